@@ -0,0 +1,52 @@
+"""
+DLP throughput: single-pass scanner vs the original one-pass-per-pattern masking.
+
+Run from the repo root:
+    python -m benchmarks.bench_dlp
+"""
+import random, re, string, time
+from shared.processors.dlp import redact
+
+LEGACY_MASKS = [
+  (re.compile(r"\b\d{16}\b"), "****-****-****-****"),
+  (re.compile(r"\b\d{3}-\d{2}-\d{4}\b"), "***-**-****"),
+  (re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"), "<email>"),
+]
+
+def legacy(text):
+    original = text
+    for rx, rep in LEGACY_MASKS:
+        text = rx.sub(rep, text)
+    return text, text != original
+
+def single_pass(text):
+    masked, found = redact(text)
+    return masked, found > 0
+
+def make_text(size, pii_rate=0.02, seed=7):
+    rng = random.Random(seed)
+    pii = ["alice.smith@example.com", "4111111111111111", "123-45-6789", "Q3-2024", "v1.2.3", "+1-555-0100"]
+    words, n = [], 0
+    while n < size:
+        w = rng.choice(pii) if rng.random() < pii_rate else \
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        words.append(w)
+        n += len(w) + 1
+    return " ".join(words)[:size]
+
+def bench(fn, text, min_time=0.5):
+    runs, t0 = 0, time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return len(text.encode()) * runs / elapsed / 1e6
+
+if __name__ == "__main__":
+    print(f"{'size':>10} {'legacy MB/s':>12} {'single MB/s':>12} {'speedup':>8}")
+    for size in (1_000, 10_000, 100_000, 1_000_000):
+        text = make_text(size)
+        assert legacy(text)[1] == single_pass(text)[1]
+        old, new = bench(legacy, text), bench(single_pass, text)
+        print(f"{size:>10} {old:>12.1f} {new:>12.1f} {new/old:>7.1f}x")
@@ -0,0 +1,66 @@
+"""
+Injection scanning over large contexts: one-pass matcher vs one re.search per hint.
+
+Two corpora per size:
+- benign:      random words on short lines, no hint completes
+- adversarial: one long line with many "reveal"/"disregard" openers and no
+               closing fragment - worst case for backtracking on `.*`
+
+Run from the repo root:
+    python -m benchmarks.bench_injection
+"""
+import random, re, string, time
+from shared.processors.matcher import MultiPatternMatcher
+from shared.processors.rules import rules
+
+BAD_HINTS = [r.pattern for r in rules.rules("injection")]
+
+LEGACY_RX = [re.compile(p, re.IGNORECASE) for p in BAD_HINTS]
+LEGACY_MAX_ADVERSARIAL = 100_000  # beyond this the per-hint regexes take minutes
+
+def legacy(text):
+    return any(rx.search(text) for rx in LEGACY_RX)
+
+matcher = MultiPatternMatcher(BAD_HINTS)
+
+def one_pass(text):
+    return matcher.search(text) is not None
+
+def benign(size, seed=11):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(5000)]
+    words += ["reveal", "system", "disregard", "ignore", "previous", "all"]
+    out, n = [], 0
+    while n < size:
+        w = rng.choice(words) + ("\n" if rng.random() < 0.08 else " ")
+        out.append(w)
+        n += len(w)
+    return "".join(out)[:size]
+
+def adversarial(size):
+    unit = "reveal the disregard of all the system "
+    return (unit * (size // len(unit) + 1))[:size]
+
+def bench(fn, text, min_time=0.3):
+    runs, t0 = 0, time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return elapsed / runs
+
+def fmt(seconds):
+    return f"{seconds*1000:10.2f} ms" if seconds is not None else f"{'skipped':>13}"
+
+if __name__ == "__main__":
+    print(f"{'corpus':<12} {'size':>10} {'legacy':>13} {'one-pass':>13} {'one-pass MB/s':>14}")
+    for name, make in (("benign", benign), ("adversarial", adversarial)):
+        for size in (1_000, 10_000, 100_000, 1_000_000, 10_000_000):
+            text = make(size)
+            new = bench(one_pass, text)
+            old = None
+            if name == "benign" or size <= LEGACY_MAX_ADVERSARIAL:
+                assert legacy(text) == one_pass(text)
+                old = bench(legacy, text)
+            print(f"{name:<12} {size:>10} {fmt(old)} {fmt(new)} {size/new/1e6:>14.1f}")
@@ -0,0 +1,92 @@
+"""
+Vector store backends: Chroma vs the memory-mapped NumPy store (float32 / float16).
+
+For every backend and size a store is built in a temp dir, then opened again
+in a fresh process to measure:
+- cold start:  open the store + first query
+- query:       median latency of single top-10 queries
+- batch:       one call with 32 query embeddings
+- peak RSS:    of the querying process
+
+Random unit vectors, dim 768 (nomic-embed-text). Chroma needs chromadb
+installed and takes a long time to build at 1M - pass smaller sizes to skip.
+
+Run from the repo root:
+    python -m benchmarks.bench_vector_store [--sizes 1000,100000,1000000] [--dim 768]
+"""
+import argparse, json, resource, statistics, subprocess, sys, tempfile, time
+import numpy as np
+
+BACKENDS = ("chroma", "numpy", "numpy-f16")
+BUILD_BATCH = 5000  # below Chroma's max batch size
+
+def open_store(backend, path):
+    if backend == "chroma":
+        from shared.rag.vector_store import ChromaVectorStore
+        return ChromaVectorStore(path, "bench")
+    from shared.rag.store_numpy import NumpyVectorStore
+    return NumpyVectorStore(path, dtype="float16" if backend == "numpy-f16" else "float32")
+
+def vectors(n, dim, seed):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def build(backend, path, size, dim):
+    store = open_store(backend, path)
+    t0 = time.perf_counter()
+    for start in range(0, size, BUILD_BATCH):
+        n = min(BUILD_BATCH, size - start)
+        store.upsert(ids=[f"v{i}" for i in range(start, start + n)],
+                     documents=[f"doc {i}" for i in range(start, start + n)],
+                     metadatas=[{"i": i} for i in range(start, start + n)],
+                     embeddings=vectors(n, dim, seed=start).tolist())
+    return {"build_s": time.perf_counter() - t0}
+
+def measure(backend, path, size, dim):
+    queries = vectors(64, dim, seed=2**31).tolist()
+    t0 = time.perf_counter()
+    store = open_store(backend, path)
+    store.query(query_embeddings=[queries[0]], n_results=10)
+    cold = time.perf_counter() - t0
+    single = []
+    for q in queries[1:32]:
+        t0 = time.perf_counter()
+        store.query(query_embeddings=[q], n_results=10)
+        single.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    store.query(query_embeddings=queries[32:], n_results=10)
+    batch = time.perf_counter() - t0
+    return {"cold_ms": cold * 1000, "query_ms": statistics.median(single) * 1000, "batch_ms": batch * 1000,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def run_worker(*args):
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_vector_store", "--worker", *map(str, args)],
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return {"error": (out.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--worker", nargs=5, help=argparse.SUPPRESS)  # phase backend path size dim
+    args = parser.parse_args()
+
+    if args.worker:
+        phase, backend, path, size, dim = args.worker
+        print(json.dumps((build if phase == "build" else measure)(backend, path, int(size), int(dim))))
+        sys.exit(0)
+
+    print(f"{'backend':<10} {'vectors':>9} {'build':>10} {'cold start':>12} {'query p50':>11} "
+          f"{'batch x32':>11} {'peak RSS':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for backend in BACKENDS:
+            with tempfile.TemporaryDirectory() as path:
+                built = run_worker("build", backend, path, size, args.dim)
+                result = built if "error" in built else run_worker("measure", backend, path, size, args.dim)
+            if "error" in result:
+                print(f"{backend:<10} {size:>9}   skipped: {result['error']}")
+                continue
+            print(f"{backend:<10} {size:>9} {built['build_s']:>9.1f}s {result['cold_ms']:>9.1f} ms "
+                  f"{result['query_ms']:>8.2f} ms {result['batch_ms']:>8.1f} ms {result['rss_mb']:>7.0f} MB")
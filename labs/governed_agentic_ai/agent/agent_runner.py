@@ -10,6 +10,16 @@ from shared.agent.guard import new_run_id, log_agent_event
 from shared.agent.mcp_stub import mcp
 from shared.evidence.logger import append_evidence
 
+# (agent, tool) pairs the Researcher -> Analyst -> Writer workflow intends to use,
+# pre-authorized in one OPA query at run start
+WORKFLOW_PLAN = [
+    ("researcher", "search_docs"),
+    ("researcher", "summarize_findings"),
+    ("analyst", "check_policy"),
+    ("analyst", "generate_report"),
+    ("writer", "write_to_file"),
+]
+
 def load_catalog(path: str | None = None) -> Dict[str, Any]:
     """
     Load agent catalog from YAML file.
@@ -164,6 +174,14 @@ def orchestrate(question="Summarize compliance state for project X", scenario="h
         "question": question
     })
     
+    # One OPA round-trip for the whole plan; off-plan tool calls still get a live check
+    mcp.preauthorize_plan(run_id, WORKFLOW_PLAN)
+    try:
+        return _run_workflow(run_id, question, scenario, researcher_id, analyst_id, writer_id)
+    finally:
+        mcp.end_run(run_id)
+
+def _run_workflow(run_id, question, scenario, researcher_id, analyst_id, writer_id):
     # Step 1: Run researcher
     research = run_researcher(run_id, researcher_id, question)
     
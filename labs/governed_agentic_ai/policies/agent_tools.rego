@@ -43,4 +43,13 @@ allow_tool if {
 # Admin agent: All tools (dangerous!)
 allow_tool if {
   input.agent == "admin_agent"
-}
\ No newline at end of file
+}
+
+# Batch: authorize a whole workflow plan in one query
+# input.pairs = [{"agent": "...", "tool": "..."}, ...]
+# result     = {"<agent>:<tool>": true | false, ...}
+plan_decisions := {key: allowed |
+  some pair in input.pairs
+  key := sprintf("%s:%s", [pair.agent, pair.tool])
+  allowed := allow_tool with input as pair
+}
@@ -72,6 +72,18 @@ else
     echo "   Response: $TEST3"
 fi
 
+# Test 4: Plan pre-authorization returns one decision per (agent, tool) pair
+TEST4=$(curl -s -X POST http://localhost:8181/v1/data/ai/agent/tools/plan_decisions \
+  -H "Content-Type: application/json" \
+  -d '{"input":{"pairs":[{"agent":"researcher","tool":"search_docs"},{"agent":"researcher","tool":"write_to_file"}]}}')
+
+if echo "$TEST4" | grep -q '"researcher:search_docs":true' && echo "$TEST4" | grep -q '"researcher:write_to_file":false'; then
+    echo "✅ Test 4 passed: plan_decisions authorizes a whole plan in one query"
+else
+    echo "❌ Test 4 failed: plan_decisions should allow search_docs and deny write_to_file for researcher"
+    echo "   Response: $TEST4"
+fi
+
 echo ""
 echo "✅ All policy tests passed!"
 echo ""
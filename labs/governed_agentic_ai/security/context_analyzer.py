@@ -2,9 +2,9 @@
 Context-aware security analysis for agentic AI systems.
 Goes beyond static allowlists to understand intent and risk.
 """
-import re
 from typing import Dict, Any, List
 from shared.evidence.logger import append_evidence
+from shared.processors.rules import rules
 
 class RiskScore:
     """Risk scoring for tool calls"""
@@ -18,31 +18,8 @@ class ContextAnalyzer:
     def __init__(self):
         self.call_history: Dict[str, List[Dict]] = {}  # run_id -> list of calls
         
-        # Suspicious patterns (more nuanced than simple blocking)
-        self.suspicious_patterns = {
-            # Exfiltration indicators
-            "exfiltrat": 40,
-            "send.*to.*@": 35,
-            "leak": 30,
-            "steal": 35,
-            "transfer.*external": 40,
-            
-            # Path traversal indicators
-            r"\.\./": 45,
-            "/etc/": 50,
-            "/root/": 50,
-            
-            # Code injection indicators
-            r"eval\(": 50,
-            r"exec\(": 50,
-            "__import__": 45,
-            
-            # Credential patterns
-            "password": 25,
-            "api[_-]?key": 30,
-            "secret": 25,
-            "token": 20,
-        }
+        # Suspicious patterns (more nuanced than simple blocking) are the weighted
+        # "context_risk" rule set in shared/processors/rules.yaml
         
         # Unusual sequences (behavioral anomaly detection)
         self.unusual_sequences = [
@@ -80,11 +57,10 @@ class ContextAnalyzer:
             return self._build_result(risk_score, reasons, run_id, agent_id, tool_name)
         
         # Factor 2: Pattern analysis in payload
-        payload_str = str(payload).lower()
-        for pattern, score in self.suspicious_patterns.items():
-            if re.search(pattern, payload_str):
-                risk_score += score
-                reasons.append(f"suspicious_pattern:{pattern}")
+        payload_str = str(payload)
+        for hit in rules.scan(payload_str).hits("context_risk"):
+            risk_score += hit.rule.weight
+            reasons.append(f"suspicious_pattern:{hit.rule.pattern}")
         
         # Factor 3: Call history / behavioral analysis
         self.call_history.setdefault(run_id, [])
@@ -4,20 +4,12 @@ Each tool enforces sandboxing and logs to evidence.
 """
 import os
 import json
-import re
 from pathlib import Path
 from shared.gateway.providers import call_llm
 from shared.evidence.logger import append_evidence
+from shared.processors.rules import rules
 
-# Exfiltration patterns to detect and block
-EXFIL_PATTERNS = [
-    r"exfiltrat",
-    r"attacker@",
-    r"send.*to.*@.*\.com",
-    r"leak.*data",
-    r"steal.*information",
-    r"transfer.*to.*external"
-]
+# Exfiltration patterns: "exfiltration" rule set in shared/processors/rules.yaml
 
 def check_exfiltration(text: str, tool_name: str) -> None:
     """
@@ -30,21 +22,22 @@ def check_exfiltration(text: str, tool_name: str) -> None:
     Raises:
         ValueError: If exfiltration pattern detected
     """
-    text_lower = text.lower()
-    
-    for pattern in EXFIL_PATTERNS:
-        if re.search(pattern, text_lower):
-            # Log detection
-            append_evidence({
-                "type": "exfil_pattern_blocked",
-                "tool": tool_name,
-                "pattern": pattern,
-                "blocked": True,
-                "action": "operation_blocked"
-            })
-            
-            # Block the operation
-            raise ValueError(f"exfiltration_detected: Pattern '{pattern}' found in content. Operation blocked for security.")
+    hit = rules.first_hit(text, "exfiltration")
+    if hit:
+        pattern = hit.rule.pattern
+        # Log detection
+        append_evidence({
+            "type": "exfil_pattern_blocked",
+            "tool": tool_name,
+            "pattern": pattern,
+            "rule_id": hit.rule.id,
+            "rules_revision": rules.revision,
+            "blocked": True,
+            "action": "operation_blocked"
+        })
+        
+        # Block the operation
+        raise ValueError(f"exfiltration_detected: Pattern '{pattern}' found in content. Operation blocked for security.")
 
 # ... (keep search_docs_tool and summarize_findings_tool as-is) ...
 
@@ -1,23 +1,78 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import os, json, asyncio, shutil, tempfile, zipfile
+from typing import List
 from fastapi import FastAPI, UploadFile, Form
-from shared.gateway.gateway import Chain
-from shared.gateway.providers import call_llm
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from shared.gateway.gateway import Chain, sse
+from shared.gateway.mapreduce import MapReduceSummarizer
+from shared.gateway.metrics import render_prometheus
+from shared.gateway.semantic_cache import semantic_cache
+from shared.gateway.providers import call_llm, stream_llm
+from shared.gateway.upload import CHUNK_BYTES, read_upload, scan_file
 from shared.processors.injection import injection_guard
-from shared.processors.dlp import dlp_pre, dlp_post
-from shared.processors.policy_opa import policy_gate
+from shared.processors.dlp import dlp_pre, dlp_post, dlp_post_stream
+from shared.processors.policy_opa import policy_gate, memoized_policy_gate
 from shared.processors.provenance import add_provenance
 
 app = FastAPI(title="PII-Safe Summarizer")
 
+# Batch endpoint limits
+BATCH_CONCURRENCY = int(os.getenv("SUMMARIZE_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("SUMMARIZE_BATCH_MAX_FILES", "1000"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("SUMMARIZE_BATCH_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+
+# single | map_reduce | auto (map-reduce only for documents that do not fit one prompt)
+SUMMARIZE_MODE = os.getenv("SUMMARIZE_MODE", "auto")
+
+def summary_prompt(text):
+    return f"Summarize into 5 bullets and 3 short action items. Be concise.\n\n{text}"
+
+def build_prompt(req):
+    return summary_prompt(req['prompt'])
+
+# Long documents: summarize chunks in parallel, then merge (partials served from the LLM response cache)
+summarizer = MapReduceSummarizer.from_env(call_llm, summary_prompt)
+
+def use_map_reduce(req):
+    return SUMMARIZE_MODE == "map_reduce" or (SUMMARIZE_MODE == "auto" and not summarizer.fits(req["prompt"]))
+
 def llm_call(req):
-    prompt = f"Summarize into 5 bullets and 3 short action items. Be concise.\n\n{req['prompt']}"
-    return {"answer": call_llm(prompt)}
+    if use_map_reduce(req):
+        return summarizer.summarize(req["prompt"])
+    return {"answer": call_llm(build_prompt(req))}
+
+def llm_stream(req):
+    if not use_map_reduce(req):
+        return {"stream": stream_llm(build_prompt(req))}
+    out = {}
+    def tokens():
+        # map phase runs before the first token; only the final merge is streamed
+        reduced = summarizer.reduce_prompt(req["prompt"])
+        out["map_reduce"] = reduced["map_reduce"]
+        yield from stream_llm(reduced["prompt"])
+    out["stream"] = tokens()
+    return out
+
+# Optional semantic cache (SEMANTIC_CACHE=true), scoped by user role + clearance
+if semantic_cache is not None:
+    llm_call = semantic_cache.wrap(llm_call, namespace="pii_summarizer")
+    llm_stream = semantic_cache.wrap_stream(llm_stream, namespace="pii_summarizer")
 
 chain = Chain(pre=[dlp_pre, injection_guard, policy_gate],
               post=[dlp_post, add_provenance],
-              llm_call=llm_call)
+              llm_call=llm_call,
+              llm_stream=llm_stream,
+              stream_post=[dlp_post_stream],
+              name="pii_summarizer")
+
+def build_request(scanned, user_role, user_clearance):
+    """scanned: {"prompt", "contains_sensitive"} from read_upload/scan_file"""
+    user = {"role": user_role}
+    if user_clearance:
+        user["clearance"] = user_clearance
+    return {**scanned, "user": user}
 
 @app.post("/summarize")
 async def summarize(
@@ -25,9 +80,149 @@ async def summarize(
     user_role: str = Form("contractor"),
     user_clearance: str = Form(None)  # ← NEW: optional clearance level
 ):
-    text = (await file.read()).decode("utf-8")[:100_000]
-    user = {"role": user_role}
-    if user_clearance:
-        user["clearance"] = user_clearance
-    req = {"prompt": text, "user": user}
-    return chain.run(req)
\ No newline at end of file
+    # Chunked read: DLP-masked and injection-scanned as it arrives, capped at SUMMARIZE_MAX_BYTES
+    scanned = await read_upload(file)
+    if scanned.get("blocked"):
+        return scanned
+    req = build_request(scanned, user_role, user_clearance)
+    return await chain.run_async(req)
+
+@app.post("/summarize/stream")
+async def summarize_stream(
+    file: UploadFile,
+    user_role: str = Form("contractor"),
+    user_clearance: str = Form(None)
+):
+    """Same guardrails as /summarize, but the summary is streamed as SSE with incremental DLP masking"""
+    scanned = await read_upload(file)
+    if scanned.get("blocked"):
+        return StreamingResponse(sse([{"event": "blocked", "data": scanned}]), media_type="text/event-stream")
+    req = build_request(scanned, user_role, user_clearance)
+    return StreamingResponse(sse(chain.run_stream(req)), media_type="text/event-stream")
+
+def _is_zip(f: UploadFile) -> bool:
+    return (f.filename or "").lower().endswith(".zip")
+
+def count_batch(files: List[UploadFile]) -> int:
+    """Documents in the batch, from the upload list and zip central directories only"""
+    n = 0
+    for f in files:
+        if not _is_zip(f):
+            n += 1
+            continue
+        try:
+            with zipfile.ZipFile(f.file) as zf:
+                n += sum(1 for info in zf.infolist() if not info.is_dir())
+        except zipfile.BadZipFile:
+            n += 1
+    return n
+
+def _spool(f: UploadFile):
+    # The framework closes uploads once the endpoint returns, before the NDJSON body
+    # is streamed, so the batch keeps its own temp-file copy (copied chunk by chunk)
+    fp = tempfile.TemporaryFile()
+    f.file.seek(0)
+    shutil.copyfileobj(f.file, fp, CHUNK_BYTES)
+    fp.seek(0)
+    return fp
+
+def _scan_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo):
+    with zf.open(info) as fp:  # decompressed chunk by chunk, capped at BATCH_MAX_FILE_BYTES
+        return scan_file(fp, BATCH_MAX_FILE_BYTES)
+
+def collect_batch(files: List[UploadFile]):
+    """
+    Expand uploads (plain files and .zip archives) into [(name, opener | error)] plus the
+    handles to close afterwards. No document is read into memory here: each opener
+    scans its document (in a thread) when awaited.
+    """
+    docs, handles = [], []
+    for f in files:
+        if not _is_zip(f):
+            if f.size is not None and f.size > BATCH_MAX_FILE_BYTES:
+                docs.append((f.filename, ValueError("file_too_large")))
+                continue
+            fp = _spool(f)
+            handles.append(fp)
+            docs.append((f.filename, lambda fp=fp: asyncio.to_thread(scan_file, fp, BATCH_MAX_FILE_BYTES)))
+            continue
+        fp = _spool(f)
+        handles.append(fp)
+        try:
+            zf = zipfile.ZipFile(fp)
+        except zipfile.BadZipFile:
+            docs.append((f.filename, ValueError("invalid_zip")))
+            continue
+        handles.append(zf)
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            name = f"{f.filename}/{info.filename}"
+            if info.file_size > BATCH_MAX_FILE_BYTES:
+                docs.append((name, ValueError("file_too_large")))
+            else:
+                docs.append((name, lambda zf=zf, info=info: asyncio.to_thread(_scan_member, zf, info)))
+    return docs, handles
+
+def close_all(handles):
+    for h in reversed(handles):
+        h.close()
+
+@app.post("/summarize_batch")
+async def summarize_batch(
+    files: List[UploadFile],
+    user_role: str = Form("contractor"),
+    user_clearance: str = Form(None)
+):
+    """
+    Summarize many files (or .zip archives) in one request.
+    Each document is read, scanned and run through the same chain inside a worker,
+    at most SUMMARIZE_BATCH_CONCURRENCY at a time. Results stream back as NDJSON
+    in completion order.
+    """
+    count = await asyncio.to_thread(count_batch, files)
+    if count > BATCH_MAX_FILES:
+        return {"blocked": True, "reason": "too_many_files", "count": count, "limit": BATCH_MAX_FILES}
+    docs, handles = await asyncio.to_thread(collect_batch, files)
+
+    # One OPA decision per distinct (user, intent, contains_sensitive) for the whole batch
+    batch_chain = Chain(pre=[dlp_pre, injection_guard, memoized_policy_gate()],
+                        post=[dlp_post, add_provenance],
+                        llm_call=llm_call,
+                        name="pii_summarizer")
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(index, name, source):
+        async with sem:
+            if isinstance(source, Exception):
+                return {"index": index, "filename": name, "error": str(source)}
+            try:
+                scanned = await source()
+            except Exception as e:
+                return {"index": index, "filename": name, "error": str(e)}
+            if scanned.get("blocked"):
+                return {"index": index, "filename": name, **scanned}
+            req = build_request(scanned, user_role, user_clearance)
+            try:
+                result = await batch_chain.run_async(req)
+            except Exception as e:
+                return {"index": index, "filename": name, "error": str(e)}
+            result.pop("prompt", None)  # don't echo whole documents back
+            return {"index": index, "filename": name, **result}
+
+    async def ndjson():
+        tasks = [asyncio.ensure_future(one(i, name, source)) for i, (name, source) in enumerate(docs)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+            close_all(handles)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-stage latency quantiles (rolling window) in Prometheus text format"""
+    return render_prometheus()
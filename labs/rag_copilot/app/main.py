@@ -2,23 +2,33 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import json
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List
-from shared.gateway.gateway import Chain
-from shared.gateway.providers import call_llm
+from typing import List, Optional
+from shared.gateway.gateway import Chain, sse
+from shared.gateway.metrics import render_prometheus
+from shared.gateway.semantic_cache import semantic_cache, user_scope
+from shared.gateway.providers import call_llm, stream_llm
 from shared.processors.injection import injection_guard
-from shared.processors.dlp import dlp_pre, dlp_post
+from shared.processors.dlp import dlp_pre, dlp_post, dlp_post_stream
 from shared.processors.policy_opa import policy_gate
 from shared.processors.provenance import add_provenance
-from shared.rag.store_chroma import reset_collection, add_docs_from_folder, query
-from labs.rag_copilot.security.sanitize import sanitize
+from shared.rag.store_chroma import reset_collection, sync_folders, query, query_many
+from shared.evidence.logger import append_evidence
+from labs.rag_copilot.security.annotations import annotate_chunk, context_guard
 
 # Configuration
 CORPUS_DIR = "labs/rag_copilot/data/corpus"
 REDTEAM_DIR = "labs/rag_copilot/redteam/ipi_pages"
 TEST_MODE = os.getenv("RAG_TEST_MODE", "false").lower() == "true"
+# incremental: only new/changed/removed files touch the collection | reset: rebuild on every start
+INGEST_MODE = os.getenv("RAG_INGEST_MODE", "incremental").lower()
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "1000"))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -26,22 +36,26 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for startup and shutdown events.
     Replaces deprecated @app.on_event("startup")
     """
-    # Startup: Ingest documents
-    reset_collection()
+    # Startup: Sync documents into the collection
+    if INGEST_MODE == "reset":
+        reset_collection()
     
-    # Ingest trusted corpus (with validation)
-    added = add_docs_from_folder(CORPUS_DIR, validate=True)
-    print(f"[Lab02] Ingested {added} trusted docs from {CORPUS_DIR}")
-    
-    # In test mode, ingest red team docs WITHOUT validation
+    # Trusted corpus is validated; in test mode red team docs are added WITHOUT validation,
+    # otherwise they are left out (and removed if a previous test-mode run ingested them)
+    folders = {CORPUS_DIR: True}
     if TEST_MODE:
-        print(f"[Lab02] 🔴 TEST MODE ACTIVE: Including red team documents")
-        redteam_added = add_docs_from_folder(REDTEAM_DIR, validate=False)
-        print(f"[Lab02] 🔴 TEST MODE: Ingested {redteam_added} red team docs (unvalidated)")
-        print(f"[Lab02] Total: {added + redteam_added} docs")
+        print(f"[Lab02] 🔴 TEST MODE ACTIVE: Including red team documents (unvalidated)")
+        folders[REDTEAM_DIR] = False
     else:
         print(f"[Lab02] Production mode: Red team docs excluded")
     
+    result = sync_folders(folders, annotate=annotate_chunk)
+    append_evidence({"type": "corpus_sync", "mode": INGEST_MODE, "test_mode": TEST_MODE, **result})
+    print(f"[Lab02] Corpus sync ({INGEST_MODE}): {result['added']} added, {result['updated']} updated, "
+          f"{result['removed']} removed, {result['rejected']} rejected, {result['unchanged']} unchanged "
+          f"-> {result['documents']} docs in {result['elapsed_ms']} ms "
+          f"({result['docs_per_s']} docs/s, peak RSS {result['peak_rss_mb']} MB)")
+    
     yield  # Application runs here
     
     # Shutdown: Cleanup if needed
@@ -53,63 +67,116 @@ app = FastAPI(title="RAG Copilot (Lab 02)", lifespan=lifespan)
 class AskBody(BaseModel):
     question: str
     user_role: str = "employee"
+    # needed when retrieved context is sensitive (context_guard sets contains_sensitive)
+    user_clearance: Optional[str] = None
 
-def llm_call(req):
+class AskBatchBody(BaseModel):
+    questions: List[str]
+    user_role: str = "employee"
+    user_clearance: Optional[str] = None
+
+def build_prompt(req):
     # Build a grounded prompt with citations
     ctx_lines = []
     for i, c in enumerate(req.get("chunks", []), start=1):
         ctx_lines.append(f"[{i}] {c['text']}\n(Source: {c['source']})")
     context = "\n\n".join(ctx_lines)
-    prompt = (
+    return (
         "You are a concise security copilot. Answer using only the provided context. "
         "Cite sources like [1], [2]. If the answer is not in the context, say 'Not found in provided context.'\n\n"
         f"Question: {req['prompt']}\n\nContext:\n{context}\n\nAnswer:"
     )
-    return {"answer": call_llm(prompt), "source_ids": [c["source"] for c in req.get("chunks", [])]}
 
-# Chain: reuse existing processors. injection_guard inspects both prompt & context.
-chain = Chain(pre=[dlp_pre, injection_guard, policy_gate],
+def llm_call(req):
+    return {"answer": call_llm(build_prompt(req)), "source_ids": [c["source"] for c in req.get("chunks", [])]}
+
+def llm_stream(req):
+    return {"stream": stream_llm(build_prompt(req)), "source_ids": [c["source"] for c in req.get("chunks", [])]}
+
+def answer_scope(req):
+    # Same role/clearance AND same retrieved chunks - a re-ingested corpus never serves stale answers
+    return (*user_scope(req), *[c["id"] for c in req.get("chunks", [])])
+
+# Optional semantic cache (SEMANTIC_CACHE=true)
+if semantic_cache is not None:
+    llm_call = semantic_cache.wrap(llm_call, namespace="rag_copilot", scope_fn=answer_scope)
+    llm_stream = semantic_cache.wrap_stream(llm_stream, namespace="rag_copilot", scope_fn=answer_scope)
+
+# Chain: reuse existing processors. context_guard checks the RAW chunks through their
+# ingest-time annotations and hands only sanitized text on; injection_guard checks the question.
+chain = Chain(pre=[dlp_pre, context_guard, injection_guard, policy_gate],
               post=[dlp_post, add_provenance],
-              llm_call=llm_call)
+              llm_call=llm_call,
+              llm_stream=llm_stream,
+              stream_post=[dlp_post_stream],
+              name="rag_copilot")
 
-@app.post("/ask")
-def ask(body: AskBody):
-    # Retrieve documents
-    hits = query(body.question, k=3)
-    
-    # Build request with UNSANITIZED context for security checks
-    req = {
+def build_request(body: AskBody, hits):
+    # RAW chunks + their ingest-time annotations; context_guard swaps in sanitized text after approval
+    user = {"role": body.user_role}
+    if body.user_clearance:
+        user["clearance"] = body.user_clearance
+    return {
         "prompt": body.question,
-        "user": {"role": body.user_role},
-        "context": "\n\n".join([h["text"] for h in hits]),  # ← RAW content
+        "user": user,
         "chunks": hits,
     }
+
+@app.post("/ask")
+async def ask(body: AskBody):
+    # Retrieve documents (embedding + vector search are blocking calls)
+    hits = await asyncio.to_thread(query, body.question, k=3)
     
-    # Run security checks on raw content
-    req = dlp_pre(req)
-    if req.get("blocked"):
-        return req
-    
-    req = injection_guard(req)
-    if req.get("blocked"):
-        return req
-    
-    req = policy_gate(req)
-    if req.get("blocked"):
-        return req
-    
-    # NOW sanitize before LLM call
-    for h in hits:
-        h["text"] = sanitize(h["text"])
-    req["context"] = "\n\n".join([h["text"] for h in hits])
-    req["chunks"] = hits
-    
-    # Call LLM with sanitized content
-    result = llm_call(req)
-    req.update(result)
-    
-    # Post-processing
-    req = dlp_post(req)
-    req = add_provenance(req)
+    req = build_request(body, hits)
     
-    return req
\ No newline at end of file
+    # dlp_pre -> (context_guard || injection_guard) -> policy_gate -> LLM -> post
+    return await chain.run_async(req)
+
+@app.post("/ask/stream")
+async def ask_stream(body: AskBody):
+    """Same guardrails as /ask, but the answer is streamed as SSE with incremental DLP masking"""
+    hits = await asyncio.to_thread(query, body.question, k=3)
+    req = build_request(body, hits)
+    return StreamingResponse(sse(chain.run_stream(req)), media_type="text/event-stream")
+
+@app.post("/ask_batch")
+async def ask_batch(body: AskBatchBody):
+    """
+    Answer many questions in one request. Retrieval for all of them is one
+    embedding call and one vector query; each question then runs through the
+    same guardrails as /ask, at most RAG_BATCH_CONCURRENCY at a time.
+    Results stream back as NDJSON in completion order.
+    """
+    if len(body.questions) > BATCH_MAX_QUESTIONS:
+        return {"blocked": True, "reason": "too_many_questions", "count": len(body.questions),
+                "limit": BATCH_MAX_QUESTIONS}
+
+    hits_list = await asyncio.to_thread(query_many, body.questions, k=3)
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(index, question, hits):
+        async with sem:
+            req = build_request(AskBody(question=question, user_role=body.user_role,
+                                                user_clearance=body.user_clearance), hits)
+            try:
+                result = await chain.run_async(req)
+            except Exception as e:
+                return {"index": index, "question": question, "error": str(e)}
+            return {"index": index, "question": question, **result}
+
+    async def ndjson():
+        tasks = [asyncio.ensure_future(one(i, q, hits))
+                 for i, (q, hits) in enumerate(zip(body.questions, hits_list))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done, default=str) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-stage latency quantiles (rolling window) in Prometheus text format"""
+    return render_prometheus()
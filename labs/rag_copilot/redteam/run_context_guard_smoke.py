@@ -0,0 +1,71 @@
+"""
+Offline smoke check for Lab 02's context_guard (no Ollama, Chroma or OPA needed):
+- Benign corpus chunks pass, with sanitized text
+- Red-team page chunks are blocked as indirect injection
+- A DLP hit in a retrieved chunk reaches the policy stage as contains_sensitive
+- An annotation from an older rules/sanitizer revision is rescanned, not trusted
+
+Run from the repo root:
+    python -m labs.rag_copilot.redteam.run_context_guard_smoke
+"""
+import asyncio, glob, sys
+from shared.gateway.gateway import Chain, stage
+from shared.processors.chunking import iter_chunks
+from shared.processors.dlp import dlp_pre
+from shared.processors.injection import injection_guard
+from labs.rag_copilot.security import annotations
+from labs.rag_copilot.security.annotations import annotate_chunk, context_guard
+
+CORPUS = ["labs/rag_copilot/data/corpus/01_security_overview.md",
+          "labs/rag_copilot/data/corpus/02_agent_safety.md",
+          "labs/rag_copilot/data/corpus/03_governance.md"]
+REDTEAM = sorted(glob.glob("labs/rag_copilot/redteam/ipi_pages/*.md"))
+
+seen = {}
+
+@stage(reads={"contains_sensitive"})
+def record_policy_input(req):
+    # stands in for policy_gate: records what OPA would be asked
+    seen["contains_sensitive"] = req.get("contains_sensitive", False)
+    return req
+
+chain = Chain(pre=[dlp_pre, context_guard, injection_guard, record_policy_input],
+              post=[], llm_call=lambda req: {"answer": "ok"}, name="rag_smoke")
+
+def chunks_of(path):
+    with open(path, encoding="utf-8") as f:
+        return [{"id": f"{path}:{i}", "text": c.text, "source": path, "annotation": annotate_chunk(c.text)}
+                for i, c in enumerate(iter_chunks(f))]
+
+def ask(chunks, question="What are the governance best practices?"):
+    seen.clear()
+    return asyncio.run(chain.run_async({"prompt": question, "user": {"role": "employee"}, "chunks": chunks}))
+
+def check(name, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {name}{f'  ({detail})' if detail else ''}")
+    return ok
+
+if __name__ == "__main__":
+    results = []
+
+    for path in CORPUS:
+        res = ask(chunks_of(path))
+        results.append(check(f"benign: {path}", not res.get("blocked"), res.get("reason", "")))
+
+    for path in REDTEAM:
+        res = ask(chunks_of(path))
+        results.append(check(f"injection blocked: {path}", res.get("reason") == "prompt_injection_suspected",
+                             res.get("reason", "not blocked")))
+
+    text = "Escalations go to the on-call lead at oncall.lead@example.com."
+    res = ask([{"id": "dlp:0", "text": text, "source": "dlp.md", "annotation": annotate_chunk(text)}])
+    results.append(check("chunk DLP hit -> contains_sensitive", seen.get("contains_sensitive") is True,
+                         f"policy input contains_sensitive={seen.get('contains_sensitive')}"))
+
+    stale = {**annotate_chunk(text), "rev": "stale"}
+    before = annotations._verdicts["rescanned"]
+    ask([{"id": "stale:0", "text": text, "source": "stale.md", "annotation": stale}])
+    results.append(check("stale annotation rescanned", annotations._verdicts["rescanned"] == before + 1))
+
+    print(f"\n{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,68 @@
+"""
+Ingest-time security annotations for corpus chunks.
+
+Corpus content only changes at ingest, so the injection verdict, DLP hits and
+sanitized text of every chunk are computed once by annotate_chunk() and stored
+in Chroma metadata. context_guard() trusts a stored annotation on the query
+path while its revision matches the current rules + sanitizer, and rescans the
+raw chunk only when it does not (e.g. rules.yaml was edited since ingest).
+"""
+from typing import Any, Dict
+from shared.gateway import metrics
+from shared.gateway.gateway import stage
+from shared.processors.dlp import scan as dlp_scan
+from shared.processors.rules import rules
+from labs.rag_copilot.security.sanitize import sanitize, SANITIZE_VERSION
+
+_verdicts = {"cached": 0, "rescanned": 0}
+
+def annotation_revision() -> str:
+    return f"{rules.revision}/sanitize-{SANITIZE_VERSION}"
+
+def annotate_chunk(text: str) -> Dict[str, Any]:
+    """Flat, Chroma-metadata-compatible annotation of one RAW chunk"""
+    hit = rules.first_hit(text, "injection")
+    detectors = sorted({name for _, _, name in dlp_scan(text)})
+    return {
+        "rev": annotation_revision(),
+        "injection": hit is not None,
+        "injection_rule": hit.rule.id if hit else "",
+        "dlp_hit": bool(detectors),
+        "dlp_detectors": ",".join(detectors),
+        "sanitized": sanitize(text),
+    }
+
+def _verdict(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    ann = chunk.get("annotation") or {}
+    if ann.get("rev") == annotation_revision():
+        _verdicts["cached"] += 1
+        return ann
+    _verdicts["rescanned"] += 1
+    return annotate_chunk(chunk["text"])
+
+@stage(reads={"chunks", "contains_sensitive"}, writes={"chunks", "contains_sensitive"})
+def context_guard(req):
+    """
+    Injection check + sanitization of retrieved chunks from their ingest-time annotations.
+
+    - Any chunk with an injection verdict = BLOCK (indirect injection)
+    - Otherwise chunks are replaced by their sanitized text
+    - A DLP hit in any chunk marks the request contains_sensitive for the policy gate
+    """
+    chunks = []
+    for c in req.get("chunks", []):
+        ann = _verdict(c)
+        if ann["injection"]:
+            return {"blocked": True, "reason": "prompt_injection_suspected",
+                    "match": {"rule": ann["injection_rule"], "in": "context", "chunk": c["id"]}}
+        chunks.append({**{k: v for k, v in c.items() if k != "annotation"},
+                       "text": ann["sanitized"], "dlp_hit": ann["dlp_hit"]})
+    req["chunks"] = chunks
+    req["contains_sensitive"] = bool(req.get("contains_sensitive")) or any(c["dlp_hit"] for c in chunks)
+    return req
+
+def _verdict_metrics():
+    return ["# TYPE rag_context_verdicts_total counter"] + \
+           [f'rag_context_verdicts_total{{source="{k}"}} {v}' for k, v in _verdicts.items()]
+
+metrics.register_collector(_verdict_metrics)
@@ -1,6 +1,8 @@
 import re
+
 TAG_RX = re.compile(r"<[^>]+>")  # naive tag strip
+SANITIZE_VERSION = "v1"  # bump when sanitize() changes - invalidates ingest-time annotations
 
 def sanitize(text: str) -> str:
     # Remove simple HTML/script tags to reduce active content risks
-    return TAG_RX.sub("", text)
\ No newline at end of file
+    return TAG_RX.sub("", text)
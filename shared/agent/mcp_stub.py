@@ -8,6 +8,8 @@ import time, uuid, os, json, requests
 from jsonschema import validate, ValidationError
 from pathlib import Path
 from shared.evidence.logger import append_evidence
+from shared.gateway.http_client import get_backend
+from shared.gateway.opa_cache import cached_decision, store_decision
 
 class ToolError(Exception):
     pass
@@ -36,6 +38,8 @@ class MCP:
         self.sandbox_dir = Path(sandbox_dir)
         self.sandbox_dir.mkdir(parents=True, exist_ok=True)
         self.opa_url = os.getenv("AGENT_OPA_URL", "http://localhost:8181/v1/data/ai/agent/tools/allow_tool")
+        self.opa_plan_url = os.getenv("AGENT_OPA_PLAN_URL", self.opa_url.rsplit("/", 1)[0] + "/plan_decisions")
+        self.plan_auth = {}  # run_id -> {(agent, tool): allowed}
 
     def register_tool(self, tool: Tool):
         self.tools[tool.name] = tool
@@ -43,36 +47,78 @@ class MCP:
     def mint_token(self):
         return f"token-{uuid.uuid4().hex[:8]}"
 
+    def preauthorize_plan(self, run_id, pairs):
+        """
+        Authorize every (agent, tool) pair a run intends to use in one OPA query.
+
+        The per-run table answers later check_allowed() calls for those pairs;
+        anything outside the plan still gets a live check. Only pairs OPA
+        actually answered are stored: if OPA cannot be queried, or returns no
+        plan_decisions (e.g. policies loaded before it existed), or leaves a
+        pair out, those pairs fall back to live checks.
+
+        Returns:
+            {(agent, tool): allowed}
+        """
+        try:
+            response = get_backend("opa").post(
+                self.opa_plan_url,
+                json={"input": {"pairs": [{"agent": a, "tool": t} for a, t in pairs]}},
+                idempotent=True
+            )
+            response.raise_for_status()
+            decisions = response.json().get("result")
+            if not isinstance(decisions, dict):
+                raise ValueError("plan_decisions returned no result - is the agent policy loaded?")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            append_evidence({
+                "type": "plan_preauthorization_failed",
+                "run_id": run_id,
+                "error": str(e)
+            })
+            return {}
+        
+        table = {(a, t): bool(decisions[f"{a}:{t}"]) for a, t in pairs if f"{a}:{t}" in decisions}
+        self.plan_auth[run_id] = table
+        append_evidence({
+            "type": "plan_preauthorized",
+            "run_id": run_id,
+            "pairs": [{"agent": a, "tool": t, "allowed": ok} for (a, t), ok in table.items()],
+            "live_check": [{"agent": a, "tool": t} for a, t in pairs if (a, t) not in table]
+        })
+        return table
+
+    def end_run(self, run_id):
+        """Drop per-run authorization state"""
+        self.plan_auth.pop(run_id, None)
+
     def check_allowed(self, tool_name, agent_id, run_id):
         """Check if agent is allowed to use this tool via OPA"""
         if tool_name not in self.tools:
             raise ToolError(f"unknown_tool:{tool_name}")
         
+        plan = self.plan_auth.get(run_id, {})
+        if (agent_id, tool_name) in plan:
+            return self._apply_decision(plan[(agent_id, tool_name)], tool_name, agent_id, run_id, source="plan")
+        
+        opa_input = {"agent": agent_id, "tool": tool_name}
+        cached, epoch = cached_decision(self.opa_url, opa_input)
+        if cached is not None:
+            return self._apply_decision(cached, tool_name, agent_id, run_id, source="cache")
+        
         # Call OPA for authorization
         try:
-            response = requests.post(
+            response = get_backend("opa").post(
                 self.opa_url,
-                json={"input": {"agent": agent_id, "tool": tool_name}},
-                timeout=2
+                json={"input": opa_input},
+                idempotent=True
             )
             
             if response.status_code == 200:
                 result = response.json()
                 allowed = result.get("result", False)
-                
-                if not allowed:
-                    # Log unauthorized attempt
-                    append_evidence({
-                        "type": "unauthorized_tool_attempt",
-                        "run_id": run_id,
-                        "agent_id": agent_id,
-                        "tool": tool_name,
-                        "blocked": True,
-                        "reason": "opa_policy_denied"
-                    })
-                    raise UnauthorizedTool(f"agent '{agent_id}' not allowed to use tool '{tool_name}'")
-                
-                return True
+                store_decision(self.opa_url, opa_input, allowed, epoch)
+                return self._apply_decision(allowed, tool_name, agent_id, run_id, source="opa")
             else:
                 # OPA error - fail closed
                 append_evidence({
@@ -95,6 +141,22 @@ class MCP:
             })
             raise ToolError(f"opa_unavailable: {str(e)}")
 
+    def _apply_decision(self, allowed, tool_name, agent_id, run_id, source):
+        """Deny decisions are written to evidence whether they came from OPA, the cache or the run plan"""
+        if not allowed:
+            # Log unauthorized attempt
+            append_evidence({
+                "type": "unauthorized_tool_attempt",
+                "run_id": run_id,
+                "agent_id": agent_id,
+                "tool": tool_name,
+                "blocked": True,
+                "reason": "opa_policy_denied",
+                "decision_source": source
+            })
+            raise UnauthorizedTool(f"agent '{agent_id}' not allowed to use tool '{tool_name}'")
+        return True
+
     def enforce_schema(self, tool: Tool, payload: dict):
         if tool.schema:
             try:
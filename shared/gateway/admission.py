@@ -0,0 +1,111 @@
+"""
+Admission control in front of the LLM backend.
+
+A local Ollama serves only a few generations at a time; sending it more just
+queues them until the HTTP timeout. AdaptiveLimiter keeps an AIMD limit on
+in-flight calls:
+- additive increase (+1/limit per call) while calls finish under the latency target
+- multiplicative decrease when a call is slower than the target or fails
+
+Calls over the limit wait in a bounded queue. When the queue is full, or a
+queued call waits longer than queue_timeout_s, the call is shed with
+Overloaded right away instead of waiting for a backend timeout. Chain turns
+Overloaded into a {"blocked": True, "reason": "overloaded"} result.
+"""
+import os, threading
+from contextlib import contextmanager
+from time import perf_counter
+from shared.gateway import metrics
+
+class Overloaded(Exception):
+    reason = "overloaded"
+
+    def __init__(self, limiter: str, retry_after_s: float):
+        super().__init__(f"{limiter} is overloaded")
+        self.retry_after_s = retry_after_s
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, initial: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 queue_depth: int = 16, queue_timeout_s: float = 30.0,
+                 latency_target_ms: float = 15000.0, backoff: float = 0.7):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_depth = queue_depth
+        self.queue_timeout_s = queue_timeout_s
+        self.latency_target_ms = latency_target_ms
+        self.backoff = backoff
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, name: str = "llm") -> "AdaptiveLimiter":
+        return cls(name,
+                   initial=int(os.getenv("LLM_CONCURRENCY", "2")),
+                   min_limit=int(os.getenv("LLM_CONCURRENCY_MIN", "1")),
+                   max_limit=int(os.getenv("LLM_CONCURRENCY_MAX", "8")),
+                   queue_depth=int(os.getenv("LLM_QUEUE_DEPTH", "16")),
+                   queue_timeout_s=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+                   latency_target_ms=float(os.getenv("LLM_LATENCY_TARGET_MS", "15000")))
+
+    def _has_slot(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    def acquire(self):
+        """Take an in-flight slot, waiting in the queue if needed; raises Overloaded"""
+        with self._cond:
+            if not self._has_slot():
+                if self.queued >= self.queue_depth:
+                    self.shed += 1
+                    raise Overloaded(self.name, self.queue_timeout_s)
+                self.queued += 1
+                try:
+                    admitted = self._cond.wait_for(self._has_slot, timeout=self.queue_timeout_s)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self.shed += 1
+                    raise Overloaded(self.name, self.queue_timeout_s)
+            self.inflight += 1
+            self.admitted += 1
+
+    def release(self, latency_ms: float, ok: bool = True):
+        """Give the slot back and adapt the limit from how the call went"""
+        with self._cond:
+            self.inflight -= 1
+            if ok and latency_ms <= self.latency_target_ms:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        t0 = perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        except GeneratorExit:
+            ok = True  # a stream consumer went away - not a backend problem
+            raise
+        finally:
+            self.release((perf_counter()-t0)*1000, ok)
+
+    def prometheus_lines(self):
+        label = f'{{limiter="{self.name}"}}'
+        return [
+            "# TYPE admission_limit gauge", f"admission_limit{label} {self.limit:.2f}",
+            "# TYPE admission_inflight gauge", f"admission_inflight{label} {self.inflight}",
+            "# TYPE admission_queued gauge", f"admission_queued{label} {self.queued}",
+            "# TYPE admission_admitted_total counter", f"admission_admitted_total{label} {self.admitted}",
+            "# TYPE admission_shed_total counter", f"admission_shed_total{label} {self.shed}",
+        ]
+
+llm_limiter = AdaptiveLimiter.from_env("llm")
+metrics.register_collector(llm_limiter.prometheus_lines)
@@ -0,0 +1,153 @@
+"""
+Exact-match response caches for the provider layer.
+
+- MemoryCache: in-process LRU bounded by total value bytes, with TTL
+- SQLiteCache: on-disk tier that survives restarts, same bounds
+- TieredCache: memory in front of SQLite, SQLite hits are promoted
+
+Caches store the raw model output. Guardrails (dlp_post, add_provenance)
+run in the Chain after call_llm returns, so cached answers go through them
+exactly like fresh ones.
+"""
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially re-formatted prompts share an entry"""
+    return " ".join(prompt.split())
+
+def cache_key(provider: str, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    raw = json.dumps([provider, model, normalize_prompt(prompt), options or {}], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Interface: get() returns None on a miss. Subclasses keep the hit/miss/eviction counters."""
+
+    def __init__(self, ttl_s: float, max_bytes: int):
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+class MemoryCache(ResponseCache):
+    def __init__(self, ttl_s: float = 3600, max_bytes: int = 32 * 1024 * 1024):
+        super().__init__(ttl_s, max_bytes)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.time() + self.ttl_s, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+class SQLiteCache(ResponseCache):
+    def __init__(self, path: str, ttl_s: float = 86400, max_bytes: int = 256 * 1024 * 1024):
+        super().__init__(ttl_s, max_bytes)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                             "key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires_at REAL, atime REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_atime ON responses(atime)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET atime = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                             (key, value, size, now + self.ttl_s, now))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, old_size in self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY atime").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+                self.evictions += 1
+
+class TieredCache(ResponseCache):
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache):
+        super().__init__(memory.ttl_s, memory.max_bytes)
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def stats(self):
+        return {**super().stats(), "evictions": self.memory.evictions + self.disk.evictions}
+
+def build_cache(mode: str, ttl_s: float, max_bytes: int, path: str) -> Optional[ResponseCache]:
+    """mode: off | memory | sqlite (memory tier in front of the on-disk tier)"""
+    if mode == "memory":
+        return MemoryCache(ttl_s, max_bytes)
+    if mode == "sqlite":
+        return TieredCache(MemoryCache(ttl_s, max_bytes), SQLiteCache(path, ttl_s, max_bytes))
+    return None
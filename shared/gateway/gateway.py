@@ -1,29 +1,236 @@
+import asyncio, json
 from time import perf_counter
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Callable, Iterable, Iterator, Optional
+from shared.gateway import metrics
+from shared.gateway.admission import Overloaded
 
 Processor = Callable[[Dict[str, Any]], Dict[str, Any]]
 
+def stage(reads: Iterable[str] = (), writes: Iterable[str] = ()):
+    """
+    Declare which request keys a processor reads and writes.
+
+    Chain.run_async uses these declarations to run independent stages
+    concurrently. Processors without a declaration act as a barrier and
+    always run on their own, in list order. A sync processor with side
+    effects (evidence, outbound calls) can set fn.aio to a coroutine
+    variant, which run_async awaits instead so that cancelling it stops it.
+    """
+    def wrap(fn):
+        fn.reads = frozenset(reads)
+        fn.writes = frozenset(writes)
+        return fn
+    return wrap
+
+def _block_reason(x: Dict[str, Any]) -> Optional[str]:
+    """Processors block either via _blocked/_reason or by returning {"blocked": True, "reason": ...}"""
+    if x.get("_blocked"):
+        return x.get("_reason") or "blocked"
+    if x.get("blocked"):
+        return x.get("reason") or "blocked"
+    return None
+
+def _blocked(x: Dict[str, Any], reason: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Blocked response; keeps the guard's "match" (which rule, where) when it reported one"""
+    out = {"blocked": True, "reason": reason, "meta": meta}
+    if x.get("match"):
+        out["match"] = x["match"]
+    return out
+
+def _overloaded(e: Overloaded, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {"blocked": True, "reason": e.reason, "retry_after_s": e.retry_after_s, "meta": meta}
+
+def _conflicts(p: Processor, q: Processor) -> bool:
+    """True if p and q must not run at the same time (RAW, WAR or WAW on a request key)"""
+    if not (hasattr(p, "reads") and hasattr(q, "reads")):
+        return True
+    return bool(p.writes & (q.reads | q.writes) or q.writes & p.reads)
+
+def plan_stages(processors: List[Processor]) -> List[List[Processor]]:
+    """
+    Group processors into layers that can run concurrently.
+
+    A processor lands in the layer after the last earlier processor it
+    conflicts with, so list order still decides the order of dependent stages.
+    """
+    layers: List[List[Processor]] = []
+    placed: List[tuple] = []  # (processor, layer index)
+    for p in processors:
+        level = 0
+        for q, lq in placed:
+            if _conflicts(p, q):
+                level = max(level, lq + 1)
+        if level == len(layers):
+            layers.append([])
+        layers[level].append(p)
+        placed.append((p, level))
+    return layers
+
 class Chain:
-    def __init__(self, pre: List[Processor], post: List[Processor], llm_call: Callable):
+    def __init__(self, pre: List[Processor], post: List[Processor], llm_call: Callable,
+                 llm_stream: Optional[Callable] = None, stream_post: Optional[List[Callable]] = None,
+                 name: str = "default"):
+        self.name = name  # label for the process-wide latency histograms
         self.pre = pre
         self.post = post
         self.llm_call = llm_call
+        # llm_stream(req) returns {"stream": <iterator of str>, ...extra fields}
+        self.llm_stream = llm_stream
+        # stream_post filters wrap the token iterator (e.g. dlp_post_stream)
+        self.stream_post = stream_post or []
+        self._pre_layers = plan_stages(pre)
+        self._post_layers = plan_stages(post)
 
     def run(self, req: Dict[str, Any]) -> Dict[str, Any]:
-        meta = {"stages": [], "p95_hint_ms": None}
+        meta = {"stages": [], "p95_hint_ms": metrics.p95(self.name, "total")}
+        t_start = perf_counter()
+        x = req
+        for p in self.pre:
+            t0 = perf_counter()
+            x = p(x)
+            self._stage(meta, p.__name__, t0)
+            reason = _block_reason(x)
+            if reason:
+                return _blocked(x, reason, meta)
+        t0 = perf_counter()
+        try:
+            y = self.llm_call(x)
+        except Overloaded as e:
+            self._stage(meta, "llm_call", t0, shed=True)
+            return _overloaded(e, meta)
+        self._stage(meta, "llm_call", t0)
+        for p in self.post:
+            t0 = perf_counter()
+            y = p({**x, **y})
+            self._stage(meta, p.__name__, t0)
+        y["meta"] = self._finish(meta, t_start)
+        return y
+
+    def run_stream(self, req: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of run(). Yields events:
+          {"event": "blocked", "data": {...}}   - a pre stage blocked the request, or the LLM was overloaded
+          {"event": "token",   "data": {"text": ...}} - a filtered answer fragment
+          {"event": "done",    "data": {...}}   - post-processed result without the answer
+        """
+        if self.llm_stream is None:
+            raise RuntimeError("chain has no llm_stream configured")
+        meta = {"stages": [], "p95_hint_ms": metrics.p95(self.name, "total")}
+        t_start = perf_counter()
         x = req
         for p in self.pre:
             t0 = perf_counter()
             x = p(x)
-            meta["stages"].append({"name": p.__name__, "latency_ms": round((perf_counter()-t0)*1000, 1)})
-            if x.get("_blocked"):
-                return {"blocked": True, "reason": x.get("_reason"), "meta": meta}
+            self._stage(meta, p.__name__, t0)
+            reason = _block_reason(x)
+            if reason:
+                yield {"event": "blocked", "data": _blocked(x, reason, meta)}
+                return
         t0 = perf_counter()
-        y = self.llm_call(x)
-        meta["stages"].append({"name": "llm_call", "latency_ms": round((perf_counter()-t0)*1000, 1)})
+        y = self.llm_stream(x)
+        tokens = y.pop("stream")
+        for f in self.stream_post:
+            tokens = f(tokens)
+        parts = []
+        try:
+            for text in tokens:
+                if not parts:
+                    meta["ttft_ms"] = round((perf_counter()-t0)*1000, 1)
+                parts.append(text)
+                yield {"event": "token", "data": {"text": text}}
+        except Overloaded as e:
+            # admission happens before the first fragment, so nothing was sent yet
+            self._stage(meta, "llm_call", t0, shed=True)
+            yield {"event": "blocked", "data": _overloaded(e, meta)}
+            return
+        self._stage(meta, "llm_call", t0)
+        y["answer"] = "".join(parts)
         for p in self.post:
             t0 = perf_counter()
             y = p({**x, **y})
-            meta["stages"].append({"name": p.__name__, "latency_ms": round((perf_counter()-t0)*1000, 1)})
-        y["meta"] = meta
-        return y
\ No newline at end of file
+            self._stage(meta, p.__name__, t0)
+        y["meta"] = self._finish(meta, t_start)
+        yield {"event": "done", "data": {k: v for k, v in y.items() if k != "answer"}}
+
+    def _stage(self, meta: Dict[str, Any], name: str, t0: float, t1: Optional[float] = None, **extra):
+        ms = ((perf_counter() if t1 is None else t1)-t0)*1000
+        metrics.observe(self.name, name, ms)
+        meta["stages"].append({"name": name, "latency_ms": round(ms, 1), **extra})
+
+    def _finish(self, meta: Dict[str, Any], t_start: float) -> Dict[str, Any]:
+        # End-to-end latency of completed requests feeds the p95 hint of later ones
+        metrics.observe(self.name, "total", (perf_counter()-t_start)*1000)
+        meta["p95_hint_ms"] = metrics.p95(self.name, "total")
+        return meta
+
+    async def run_async(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Same contract as run(), but independent stages run concurrently.
+
+        Sync processors run in worker threads, coroutine processors are
+        awaited directly. Results of a layer are taken in declared order, so
+        when several stages of a layer block, the reason is always that of
+        the first one in the list (as with run()), whichever finishes first.
+        A blocking stage cancels the stages after it. Only coroutines are
+        really stopped: a sync stage already running in a worker thread
+        finishes, and its result is discarded. Give such a stage an .aio
+        coroutine (see stage()) if it must not act after the block.
+        """
+        meta = {"stages": [], "p95_hint_ms": metrics.p95(self.name, "total")}
+        t_start = perf_counter()
+        x = req
+        for layer in self._pre_layers:
+            x, reason = await self._run_layer(layer, x, meta)
+            if reason:
+                return _blocked(x, reason, meta)
+        t0 = perf_counter()
+        try:
+            y = await _call(self.llm_call, x)
+        except Overloaded as e:
+            self._stage(meta, "llm_call", t0, shed=True)
+            return _overloaded(e, meta)
+        self._stage(meta, "llm_call", t0)
+        y = {**x, **y}
+        for layer in self._post_layers:
+            y, _ = await self._run_layer(layer, y, meta)
+        y["meta"] = self._finish(meta, t_start)
+        return y
+
+    async def _run_layer(self, layer: List[Processor], x: Dict[str, Any], meta: Dict[str, Any]):
+        if len(layer) == 1:
+            p = layer[0]
+            t0 = perf_counter()
+            out = await _call(p, x)
+            self._stage(meta, p.__name__, t0)
+            return out, _block_reason(out)
+
+        async def timed(p):
+            t0 = perf_counter()
+            out = await _call(p, x)
+            return out, t0, perf_counter()
+
+        tasks = [asyncio.ensure_future(timed(p)) for p in layer]
+        try:
+            for p, task in zip(layer, tasks):
+                out, t0, t1 = await task
+                self._stage(meta, p.__name__, t0, t1, parallel=True)
+                reason = _block_reason(out)
+                if reason:
+                    return out, reason
+                if out is not x:
+                    x.update({k: out[k] for k in p.writes if k in out})
+        finally:
+            for task in tasks:
+                task.cancel()
+        return x, None
+
+async def _call(fn: Callable, x: Dict[str, Any]) -> Dict[str, Any]:
+    fn = getattr(fn, "aio", fn)
+    if asyncio.iscoroutinefunction(fn):
+        return await fn(x)
+    return await asyncio.to_thread(fn, x)
+
+def sse(events: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Format Chain.run_stream events as Server-Sent Events"""
+    for e in events:
+        yield f"event: {e['event']}\ndata: {json.dumps(e['data'])}\n\n"
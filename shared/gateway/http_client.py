@@ -0,0 +1,147 @@
+"""
+Shared, pooled HTTP clients for the backends the gateway talks to.
+
+One Backend per service (Ollama generation, Ollama embeddings, OPA):
+- a requests.Session with a keep-alive connection pool
+- a base URL resolved once per process (not on every call)
+- a per-backend timeout
+- retry with exponential backoff, only for calls the caller marks idempotent
+
+Sync code calls post()/get(); async code awaits apost()/aget(), which run the
+same pooled session in a worker thread.
+"""
+import asyncio, os, threading, time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from shared.gateway import metrics
+
+RETRY_STATUSES = {502, 503, 504}
+
+def resolve_ollama_host() -> str:
+    # Check if OLLAMA_HOST is explicitly set in .env
+    ollama_host = os.getenv("OLLAMA_HOST")
+
+    # Only auto-detect if OLLAMA_HOST is not set
+    if not ollama_host:
+        ollama_host = "http://localhost:11434"
+
+        # If running in WSL and no explicit host, try to find Windows host
+        if "WSL" in os.uname().release:
+            try:
+                with open("/etc/resolv.conf", "r") as f:
+                    for line in f:
+                        if line.startswith("nameserver"):
+                            windows_host = line.split()[1]
+                            ollama_host = f"http://{windows_host}:11434"
+                            break
+            except:
+                pass
+    return ollama_host.rstrip("/")
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+class Backend:
+    def __init__(self, name: str, resolve_base_url: Callable[[], str], timeout: float,
+                 retries: int = 0, backoff_s: float = 0.1, pool_size: int = 16):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._resolve = resolve_base_url
+        self._base_url: Optional[str] = None
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests = 0
+        self.retried = 0
+        self.errors = 0
+
+    @property
+    def base_url(self) -> str:
+        if self._base_url is None:
+            with self._lock:
+                if self._base_url is None:
+                    self._base_url = self._resolve()
+        return self._base_url
+
+    def url(self, path: str) -> str:
+        """Absolute URLs pass through (e.g. a full OPA rule URL), paths are joined to the base URL"""
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path
+
+    def request(self, method: str, path: str, idempotent: bool = False,
+                timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            self.requests += 1
+            try:
+                r = self.session.request(method, self.url(path), timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    self.errors += 1
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES or last:
+                    return r
+                r.close()
+            self.retried += 1
+            time.sleep(self.backoff_s * (2 ** attempt))
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, idempotent=True, **kwargs)
+
+    async def apost(self, path: str, **kwargs) -> requests.Response:
+        return await asyncio.to_thread(self.post, path, **kwargs)
+
+    async def aget(self, path: str, **kwargs) -> requests.Response:
+        return await asyncio.to_thread(self.get, path, **kwargs)
+
+def _make(name: str) -> Backend:
+    if name == "ollama":
+        return Backend("ollama", resolve_ollama_host,
+                       timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")),
+                       retries=int(os.getenv("OLLAMA_RETRIES", "2")))
+    if name == "ollama_embed":
+        # OLLAMA_URL keeps working for embeddings; otherwise same host as generation
+        return Backend("ollama_embed", lambda: (os.getenv("OLLAMA_URL") or resolve_ollama_host()).rstrip("/"),
+                       timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")),
+                       retries=int(os.getenv("OLLAMA_RETRIES", "2")))
+    if name == "opa":
+        return Backend("opa", lambda: _origin(os.getenv("OPA_URL", "http://localhost:8181/v1/data/ai/policy/allow")),
+                       timeout=float(os.getenv("OPA_TIMEOUT", "2")),
+                       retries=int(os.getenv("OPA_RETRIES", "1")),
+                       backoff_s=0.05)
+    raise KeyError(f"unknown backend: {name}")
+
+_backends: Dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name: str) -> Backend:
+    """Process-wide Backend for 'ollama', 'ollama_embed' or 'opa'"""
+    b = _backends.get(name)
+    if b is None:
+        with _backends_lock:
+            b = _backends.get(name) or _backends.setdefault(name, _make(name))
+    return b
+
+def _http_metrics():
+    lines = []
+    for metric, attr in (("backend_requests_total", "requests"), ("backend_retries_total", "retried"),
+                         ("backend_errors_total", "errors")):
+        lines.append(f"# TYPE {metric} counter")
+        for name, b in sorted(_backends.items()):
+            lines.append(f'{metric}{{backend="{name}"}} {getattr(b, attr)}')
+    return lines
+
+metrics.register_collector(_http_metrics)
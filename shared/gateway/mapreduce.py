@@ -0,0 +1,95 @@
+"""
+Map-reduce summarization for documents larger than one prompt.
+
+- map: the (already DLP-masked) text is split into token-bounded chunks and
+  each chunk is summarized on its own, at most `concurrency` LLM calls at a time
+- reduce: the partial summaries are merged into the final summary; if they
+  are still too long for one prompt they are merged in groups first
+
+Map prompts are deterministic (fixed instruction + chunk text), so partial
+summaries are served from the LLM response cache (LLM_CACHE): re-uploading a
+slightly edited document only re-summarizes the chunks that changed.
+
+A document goes through map-reduce in SUMMARIZE_MODE=auto only when it does
+not fit a single prompt: MAPREDUCE_SINGLE_MAX_TOKENS, by default the model's
+context window (LLM_CONTEXT_TOKENS) minus room for the instruction and answer.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from shared.processors.chunking import estimate_tokens, split_text
+
+MAP_PROMPT = ("Summarize this section of a longer document in at most 5 short bullets. "
+              "Keep names, numbers and decisions.\n\n{text}")
+MERGE_PROMPT = ("Merge these section summaries of one document into at most 8 bullets "
+                "without losing decisions or action items.\n\n{text}")
+
+PROMPT_RESERVE_TOKENS = 512  # instruction + answer, kept free in the context window
+
+class MapReduceSummarizer:
+    def __init__(self, llm: Callable[[str], str], final_prompt: Callable[[str], str],
+                 chunk_tokens: int = 1500, reduce_tokens: int = 3000, concurrency: int = 4,
+                 single_max_tokens: int = 2048 - PROMPT_RESERVE_TOKENS):
+        """
+        Args:
+            llm: prompt -> completion (e.g. providers.call_llm, whose response cache
+                 also serves repeated map prompts)
+            final_prompt: text -> prompt for the final reduce step
+            chunk_tokens: max estimated tokens per map chunk
+            reduce_tokens: max estimated tokens of partial summaries per reduce prompt
+            single_max_tokens: largest text (estimated tokens) summarized with a single prompt
+        """
+        self.llm = llm
+        self.final_prompt = final_prompt
+        self.chunk_tokens = chunk_tokens
+        self.reduce_tokens = reduce_tokens
+        self.concurrency = concurrency
+        self.single_max_tokens = single_max_tokens
+
+    @classmethod
+    def from_env(cls, llm: Callable[[str], str], final_prompt: Callable[[str], str]):
+        return cls(llm, final_prompt,
+                   chunk_tokens=int(os.getenv("MAPREDUCE_CHUNK_TOKENS", "1500")),
+                   reduce_tokens=int(os.getenv("MAPREDUCE_REDUCE_TOKENS", "3000")),
+                   concurrency=int(os.getenv("MAPREDUCE_CONCURRENCY", "4")),
+                   single_max_tokens=int(os.getenv(
+                       "MAPREDUCE_SINGLE_MAX_TOKENS",
+                       str(int(os.getenv("LLM_CONTEXT_TOKENS", "2048")) - PROMPT_RESERVE_TOKENS))))
+
+    def fits(self, text: str) -> bool:
+        """True if text is small enough to summarize with a single prompt"""
+        return estimate_tokens(text) <= self.single_max_tokens
+
+    def _summarize_chunk(self, chunk: str) -> str:
+        return self.llm(MAP_PROMPT.format(text=chunk))
+
+    def _parallel(self, fn: Callable[[str], Any], items: List[str]) -> List[Any]:
+        if len(items) == 1:
+            return [fn(items[0])]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as pool:
+            return list(pool.map(fn, items))
+
+    def map(self, text: str) -> List[str]:
+        """Partial summary per chunk, in document order"""
+        return self._parallel(self._summarize_chunk, split_text(text, max_tokens=self.chunk_tokens))
+
+    def collapse(self, partials: List[str]) -> str:
+        """Merge partial summaries in groups until they fit one reduce prompt"""
+        text = "\n\n".join(partials)
+        while estimate_tokens(text) > self.reduce_tokens and len(partials) > 1:
+            groups = split_text(text, max_tokens=self.reduce_tokens, min_tokens=self.reduce_tokens)
+            if len(groups) >= len(partials):
+                break  # summaries too long to pair up - let the final prompt take them as they are
+            partials = self._parallel(lambda g: self.llm(MERGE_PROMPT.format(text=g)), groups)
+            text = "\n\n".join(partials)
+        return text
+
+    def reduce_prompt(self, text: str) -> Dict[str, Any]:
+        """Run the map phase; returns the final prompt plus stats (for streaming the reduce step)"""
+        mapped = self.map(text)
+        merged = self.collapse(mapped)
+        return {"prompt": self.final_prompt(merged), "map_reduce": {"chunks": len(mapped)}}
+
+    def summarize(self, text: str) -> Dict[str, Any]:
+        reduced = self.reduce_prompt(text)
+        return {"answer": self.llm(reduced["prompt"]), "map_reduce": reduced["map_reduce"]}
@@ -0,0 +1,112 @@
+"""
+Process-wide latency histograms for gateway stages.
+
+Every Chain records each stage (dlp_pre, injection_guard, policy_gate,
+llm_call, ...) into a fixed log-bucket histogram keyed by (chain, stage).
+Histograms keep a rolling window made of a few time slots, so quantiles
+follow recent load instead of the whole process lifetime.
+"""
+import math, threading, time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Fixed log buckets: 10us .. ~10min, each bucket 15% wider than the previous
+BUCKET_BASE_MS = 0.01
+BUCKET_GROWTH = 1.15
+N_BUCKETS = 128
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+WINDOW_SECONDS = 60
+WINDOW_SLOTS = 6
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _bucket(ms: float) -> int:
+    if ms <= BUCKET_BASE_MS:
+        return 0
+    return min(int(math.log(ms / BUCKET_BASE_MS) / _LOG_GROWTH), N_BUCKETS - 1)
+
+def _edges_ms(i: int) -> Tuple[float, float]:
+    lower = 0.0 if i == 0 else BUCKET_BASE_MS * BUCKET_GROWTH ** i
+    return lower, BUCKET_BASE_MS * BUCKET_GROWTH ** (i + 1)
+
+class LatencyHistogram:
+    """Rolling log-bucket histogram. record() holds the lock for a couple of integer updates only."""
+
+    def __init__(self, window_s: float = WINDOW_SECONDS, slots: int = WINDOW_SLOTS):
+        self.slot_s = window_s / slots
+        self._slots = [[0] * N_BUCKETS for _ in range(slots)]
+        self._epochs = [-1] * slots
+        self._lock = threading.Lock()
+        self.count = 0      # lifetime totals, for Prometheus _count/_sum
+        self.sum_ms = 0.0
+
+    def record(self, ms: float):
+        b = _bucket(ms)
+        epoch = int(time.monotonic() / self.slot_s)
+        i = epoch % len(self._slots)
+        with self._lock:
+            if self._epochs[i] != epoch:
+                self._slots[i] = [0] * N_BUCKETS
+                self._epochs[i] = epoch
+            self._slots[i][b] += 1
+            self.count += 1
+            self.sum_ms += ms
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> Dict[float, float]:
+        """Quantiles over the rolling window, interpolated inside a bucket. Empty window -> {}"""
+        oldest = int(time.monotonic() / self.slot_s) - len(self._slots) + 1
+        merged = [0] * N_BUCKETS
+        with self._lock:
+            for epoch, counts in zip(self._epochs, self._slots):
+                if epoch >= oldest:
+                    merged = [a + b for a, b in zip(merged, counts)]
+        total = sum(merged)
+        if not total:
+            return {}
+        out, seen, i = {}, 0, 0
+        for q in sorted(qs):
+            rank = q * total
+            while i < N_BUCKETS - 1 and seen + merged[i] < rank:
+                seen += merged[i]
+                i += 1
+            lower, upper = _edges_ms(i)
+            frac = (rank - seen) / merged[i] if merged[i] else 1.0
+            out[q] = round(lower + (upper - lower) * min(max(frac, 0.0), 1.0), 3)
+        return out
+
+_histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+_collectors: List[Callable[[], Iterable[str]]] = []
+_registry_lock = threading.Lock()
+
+def histogram(chain: str, stage: str) -> LatencyHistogram:
+    h = _histograms.get((chain, stage))
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault((chain, stage), LatencyHistogram())
+    return h
+
+def observe(chain: str, stage: str, ms: float):
+    histogram(chain, stage).record(ms)
+
+def p95(chain: str, stage: str):
+    """Rolling p95 in ms, or None when the stage has no recent samples"""
+    h = _histograms.get((chain, stage))
+    return h.quantiles((0.95,)).get(0.95) if h else None
+
+def register_collector(fn: Callable[[], Iterable[str]]):
+    """Add extra Prometheus text lines (counters from caches, limiters, ...) to /metrics"""
+    _collectors.append(fn)
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP gateway_stage_latency_ms Gateway stage latency, quantiles over a rolling window",
+        "# TYPE gateway_stage_latency_ms summary",
+    ]
+    for (chain, stage), h in sorted(_histograms.items()):
+        labels = f'chain="{chain}",stage="{stage}"'
+        for q, v in h.quantiles().items():
+            lines.append(f'gateway_stage_latency_ms{{{labels},quantile="{q}"}} {v}')
+        lines.append(f"gateway_stage_latency_ms_sum{{{labels}}} {round(h.sum_ms, 3)}")
+        lines.append(f"gateway_stage_latency_ms_count{{{labels}}} {h.count}")
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
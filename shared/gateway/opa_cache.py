@@ -0,0 +1,139 @@
+"""
+Decision cache in front of OPA.
+
+OPA inputs come from a tiny set of values - (role, clearance, intent,
+contains_sensitive) for policy_gate and (agent, tool) for MCP.check_allowed -
+so decisions are cached by the canonicalized input (and rule URL):
+- entries expire after ttl_s and the cache holds at most max_entries (LRU)
+- a background thread polls /v1/policies every poll_interval_s; when the
+  loaded policies change, every cached decision is dropped
+- if OPA cannot be polled, the cache is dropped too, so callers go back to
+  asking OPA (and fail closed) instead of serving decisions nobody can confirm
+
+Every invalidation bumps an epoch; a decision that was fetched while the
+cache was being invalidated is dropped instead of stored, so it can never be
+served under the new policy. Only successful decisions are cached; errors
+always go to the caller.
+"""
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from shared.gateway import metrics
+from shared.gateway.http_client import get_backend
+
+_MISS = object()
+
+class OPADecisionCache:
+    def __init__(self, ttl_s: float = 60.0, max_entries: int = 1024, poll_interval_s: float = 5.0):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.poll_interval_s = poll_interval_s
+        self.revision: Optional[str] = None
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._epoch = 0  # bumped by invalidate(); put() drops decisions fetched before it
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["OPADecisionCache"]:
+        if os.getenv("OPA_CACHE", "true").lower() != "true":
+            return None
+        return cls(ttl_s=float(os.getenv("OPA_CACHE_TTL", "60")),
+                   max_entries=int(os.getenv("OPA_CACHE_MAX_ENTRIES", "1024")),
+                   poll_interval_s=float(os.getenv("OPA_REVISION_POLL_S", "5")))
+
+    @staticmethod
+    def key(url: str, opa_input: Dict[str, Any]) -> str:
+        return json.dumps([url, opa_input], sort_keys=True, separators=(",", ":"))
+
+    def get(self, url: str, opa_input: Dict[str, Any]) -> tuple:
+        """(cached OPA result or _MISS, epoch); hand the epoch back to put()"""
+        self._ensure_poller()
+        k = self.key(url, opa_input)
+        with self._lock:
+            entry = self._data.get(k)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[k]
+                self.misses += 1
+                return _MISS, self._epoch
+            self._data.move_to_end(k)
+            self.hits += 1
+            return entry[1], self._epoch
+
+    def put(self, url: str, opa_input: Dict[str, Any], result: Any, epoch: int):
+        """Store a decision fetched after get() returned epoch, unless the cache was invalidated since"""
+        k = self.key(url, opa_input)
+        with self._lock:
+            if epoch != self._epoch:
+                return  # fetched under a policy revision that is no longer loaded
+            self._data[k] = (time.monotonic() + self.ttl_s, result)
+            self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._epoch += 1
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+
+    def _policy_revision(self) -> str:
+        r = get_backend("opa").get("/v1/policies")
+        r.raise_for_status()
+        return hashlib.sha256(r.content).hexdigest()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval_s)
+            try:
+                revision = self._policy_revision()
+            except Exception:
+                revision = None
+            if revision is None or revision != self.revision:
+                self.invalidate()
+            self.revision = revision
+
+    def _ensure_poller(self):
+        if self._poller is not None:
+            return
+        # The first OPA round-trip happens outside the lock so get()/put() never wait on it
+        try:
+            revision = self._policy_revision()
+        except Exception:
+            revision = None
+        with self._lock:
+            if self._poller is None:
+                self.revision = revision
+                self._poller = threading.Thread(target=self._poll, name="opa-revision-poll", daemon=True)
+                self._poller.start()
+
+    def prometheus_lines(self):
+        return [
+            "# TYPE opa_decision_cache_hits_total counter", f"opa_decision_cache_hits_total {self.hits}",
+            "# TYPE opa_decision_cache_misses_total counter", f"opa_decision_cache_misses_total {self.misses}",
+            "# TYPE opa_decision_cache_invalidations_total counter",
+            f"opa_decision_cache_invalidations_total {self.invalidations}",
+        ]
+
+opa_cache = OPADecisionCache.from_env()
+if opa_cache is not None:
+    metrics.register_collector(opa_cache.prometheus_lines)
+
+def cached_decision(url: str, opa_input: Dict[str, Any]) -> tuple:
+    """
+    (cached result for this input or None on a miss, epoch). Pass the epoch to
+    store_decision() so a decision fetched across an invalidation is not cached.
+    """
+    if opa_cache is None:
+        return None, 0
+    result, epoch = opa_cache.get(url, opa_input)
+    return (None if result is _MISS else result), epoch
+
+def store_decision(url: str, opa_input: Dict[str, Any], result: Any, epoch: int):
+    if opa_cache is not None:
+        opa_cache.put(url, opa_input, result, epoch)
@@ -1,31 +1,99 @@
-import os, requests
+import os, json
+from typing import Any, Dict, Iterator, Optional
+from shared.gateway import metrics
+from shared.gateway.admission import llm_limiter
+from shared.gateway.cache import ResponseCache, build_cache, cache_key
+from shared.gateway.http_client import get_backend
+from shared.gateway.singleflight import SingleFlight
 
-def call_llm(prompt: str) -> str:
+# Exact-match response cache (off | memory | sqlite). Answers are cached raw -
+# dlp_post/add_provenance still run on them in the Chain.
+_cache: Optional[ResponseCache] = build_cache(
+    mode=os.getenv("LLM_CACHE", "memory"),
+    ttl_s=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    path=os.getenv("LLM_CACHE_PATH", "./cache/llm_responses.sqlite"),
+)
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    """Plug in a different cache implementation (or None to disable caching)"""
+    global _cache
+    _cache = cache
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _cache
+
+def _cache_metrics():
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    return [
+        "# TYPE llm_cache_hits_total counter", f"llm_cache_hits_total {stats['hits']}",
+        "# TYPE llm_cache_misses_total counter", f"llm_cache_misses_total {stats['misses']}",
+        "# TYPE llm_cache_evictions_total counter", f"llm_cache_evictions_total {stats['evictions']}",
+    ]
+
+metrics.register_collector(_cache_metrics)
+
+# Identical concurrent prompts share one in-flight generation
+_flight = SingleFlight("llm")
+
+def _generate_body(model: str, prompt: str, stream: bool, options: Optional[Dict[str, Any]]):
+    body = {"model": model, "prompt": prompt, "stream": stream}
+    if options:
+        body["options"] = options
+    return body
+
+def call_llm(prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
     prov = os.getenv("MODEL_PROVIDER", "ollama")
     if prov == "ollama":
         model = os.getenv("GEN_MODEL", "llama3.2:3b")
-        
-        # Check if OLLAMA_HOST is explicitly set in .env
-        ollama_host = os.getenv("OLLAMA_HOST")
-        
-        # Only auto-detect if OLLAMA_HOST is not set
-        if not ollama_host:
-            ollama_host = "http://localhost:11434"
-            
-            # If running in WSL and no explicit host, try to find Windows host
-            if "WSL" in os.uname().release:
-                try:
-                    with open("/etc/resolv.conf", "r") as f:
-                        for line in f:
-                            if line.startswith("nameserver"):
-                                windows_host = line.split()[1]
-                                ollama_host = f"http://{windows_host}:11434"
-                                break
-                except:
-                    pass
-        
-        r = requests.post(f"{ollama_host}/api/generate",
-                          json={"model": model, "prompt": prompt, "stream": False}, timeout=120)
+        key = cache_key(prov, model, prompt, options)
+        if _cache is not None:
+            cached = _cache.get(key)
+            if cached is not None:
+                return cached
+        return _flight.do(key, lambda: _generate(key, model, prompt, options))
+    raise RuntimeError("Only ollama provider is configured for now")
+
+def _generate(key, model, prompt, options):
+    # Generation is not retried: it is expensive and not guaranteed to be idempotent.
+    # The admission slot is taken by the single-flight leader only.
+    with llm_limiter.slot():
+        r = get_backend("ollama").post("/api/generate", json=_generate_body(model, prompt, False, options))
+        r.raise_for_status()
+    answer = r.json().get("response","")
+    if _cache is not None:
+        _cache.set(key, answer)
+    return answer
+
+def stream_llm(prompt: str, options: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """Yield response fragments as the model generates them (Ollama NDJSON stream)"""
+    prov = os.getenv("MODEL_PROVIDER", "ollama")
+    if prov != "ollama":
+        raise RuntimeError("Only ollama provider is configured for now")
+    model = os.getenv("GEN_MODEL", "llama3.2:3b")
+    key = cache_key(prov, model, prompt, options)
+    if _cache is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    # The slot is held until the stream completes
+    with llm_limiter.slot(), \
+         get_backend("ollama").post("/api/generate", json=_generate_body(model, prompt, True, options),
+                                    stream=True) as r:
         r.raise_for_status()
-        return r.json().get("response","")
-    raise RuntimeError("Only ollama provider is configured for now")
\ No newline at end of file
+        for line in r.iter_lines():
+            if not line:
+                continue
+            part = json.loads(line)
+            if part.get("response"):
+                parts.append(part["response"])
+                yield part["response"]
+            if part.get("done"):
+                # only complete generations are cached
+                if _cache is not None:
+                    _cache.set(key, "".join(parts))
+                break
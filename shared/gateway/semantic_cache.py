@@ -0,0 +1,178 @@
+"""
+Semantic response cache.
+
+Embeds the (already DLP-masked) prompt with the RAG embedding model and
+returns a previous answer when a near-duplicate prompt was answered before
+in the same scope. The scope always includes the user's role and clearance,
+so an answer produced for a PII-approved employee is never served to a
+contractor or a regular employee.
+
+The cache wraps llm_call, i.e. it sits after the pre stages (the request was
+already authorized) and before the post stages (dlp_post/add_provenance still
+run on a cached answer).
+"""
+import os, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from shared.gateway import metrics
+from shared.rag.ollama_embed import embed_text
+
+Scope = Tuple[str, ...]
+
+def user_scope(req: Dict[str, Any]) -> Scope:
+    user = req.get("user", {})
+    return (str(user.get("role", "")), str(user.get("clearance", "")))
+
+class _Entry:
+    __slots__ = ("scope", "vec", "value", "size", "expires_at")
+
+    def __init__(self, scope, vec, value, size, expires_at):
+        self.scope = scope
+        self.vec = vec
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 3600,
+                 embed: Callable[[str], list] = embed_text):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.embed = embed
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # LRU order
+        self._scopes: Dict[Scope, Dict[int, _Entry]] = {}
+        self._matrices: Dict[Scope, Tuple[list, np.ndarray]] = {}  # lazily stacked per scope
+        self._bytes = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        if os.getenv("SEMANTIC_CACHE", "false").lower() != "true":
+            return None
+        return cls(threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                   max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+                   max_bytes=int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                   ttl_s=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")))
+
+    def lookup(self, scope: Scope, vec: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self._lock:
+            if not self._scopes.get(scope):
+                self.misses += 1
+                return None
+            ids, matrix = self._matrix(scope)
+            sims = matrix @ vec
+            best = int(np.argmax(sims))
+            entry = self._entries[ids[best]]
+            if entry.expires_at < time.time():
+                self._evict(ids[best])
+                entry = None
+            if entry is None or sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ids[best])
+            self.hits += 1
+            return entry.value, float(sims[best])
+
+    def store(self, scope: Scope, vec: np.ndarray, value: Dict[str, Any]):
+        size = vec.nbytes + sum(len(str(v)) for v in value.values())
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            entry = _Entry(scope, vec, value, size, time.time() + self.ttl_s)
+            self._entries[eid] = entry
+            self._scopes.setdefault(scope, {})[eid] = entry
+            self._matrices.pop(scope, None)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, eid: int):
+        entry = self._entries.pop(eid)
+        del self._scopes[entry.scope][eid]
+        if not self._scopes[entry.scope]:
+            del self._scopes[entry.scope]
+        self._matrices.pop(entry.scope, None)
+        self._bytes -= entry.size
+        self.evictions += 1
+
+    def _matrix(self, scope: Scope):
+        if scope not in self._matrices:
+            ids = list(self._scopes[scope])
+            self._matrices[scope] = (ids, np.stack([self._scopes[scope][i].vec for i in ids]))
+        return self._matrices[scope]
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            vec = np.asarray(self.embed(text), dtype=np.float32)
+        except Exception:
+            return None  # embedding backend down - just skip the cache
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def wrap(self, llm_call: Callable, namespace: str,
+             scope_fn: Callable[[Dict[str, Any]], Scope] = user_scope) -> Callable:
+        """Return an llm_call that answers near-duplicate prompts from the cache"""
+        def cached_llm_call(req):
+            scope = (namespace, *scope_fn(req))
+            vec = self._embed(req.get("prompt", ""))
+            if vec is not None:
+                hit = self.lookup(scope, vec)
+                if hit:
+                    value, sim = hit
+                    return {**value, "semantic_cache": {"hit": True, "similarity": round(sim, 4)}}
+            out = llm_call(req)
+            if vec is not None and out.get("answer"):
+                self.store(scope, vec, out)
+            return out
+        cached_llm_call.__name__ = llm_call.__name__
+        return cached_llm_call
+
+    def wrap_stream(self, llm_stream: Callable, namespace: str,
+                    scope_fn: Callable[[Dict[str, Any]], Scope] = user_scope) -> Callable:
+        """Streaming counterpart of wrap(): a hit is replayed as a single fragment"""
+        def cached_llm_stream(req):
+            scope = (namespace, *scope_fn(req))
+            vec = self._embed(req.get("prompt", ""))
+            if vec is not None:
+                hit = self.lookup(scope, vec)
+                if hit:
+                    value, sim = hit
+                    extra = {k: v for k, v in value.items() if k != "answer"}
+                    return {**extra, "stream": iter([value["answer"]]),
+                            "semantic_cache": {"hit": True, "similarity": round(sim, 4)}}
+            out = llm_stream(req)
+            if vec is not None:
+                out["stream"] = self._record(out["stream"], scope, vec,
+                                             {k: v for k, v in out.items() if k != "stream"})
+            return out
+        cached_llm_stream.__name__ = llm_stream.__name__
+        return cached_llm_stream
+
+    def _record(self, tokens: Iterator[str], scope: Scope, vec: np.ndarray, extra: Dict[str, Any]):
+        parts = []
+        for t in tokens:
+            parts.append(t)
+            yield t
+        if parts:
+            self.store(scope, vec, {**extra, "answer": "".join(parts)})
+
+    def prometheus_lines(self):
+        return [
+            "# TYPE semantic_cache_hits_total counter", f"semantic_cache_hits_total {self.hits}",
+            "# TYPE semantic_cache_misses_total counter", f"semantic_cache_misses_total {self.misses}",
+            "# TYPE semantic_cache_evictions_total counter", f"semantic_cache_evictions_total {self.evictions}",
+            "# TYPE semantic_cache_entries gauge", f"semantic_cache_entries {len(self._entries)}",
+            "# TYPE semantic_cache_bytes gauge", f"semantic_cache_bytes {self._bytes}",
+        ]
+
+semantic_cache = SemanticCache.from_env()
+if semantic_cache is not None:
+    metrics.register_collector(semantic_cache.prometheus_lines)
@@ -0,0 +1,64 @@
+"""
+Request coalescing ("single-flight").
+
+Concurrent calls with the same key share one in-flight backend call: the
+first caller (the leader) runs it, everyone arriving while it is running
+waits for and receives the same result, or the same exception.
+Nothing is cached once the call completes - that is the response caches' job.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+from shared.gateway import metrics
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0   # calls that actually reached the backend
+        self.coalesced = 0  # calls that piggy-backed on an in-flight one
+        _groups.append(self)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+_groups: List[SingleFlight] = []
+
+def _singleflight_metrics():
+    lines = ["# TYPE singleflight_executed_total counter"]
+    lines += [f'singleflight_executed_total{{group="{g.name}"}} {g.executed}' for g in _groups]
+    lines.append("# TYPE singleflight_coalesced_total counter")
+    lines += [f'singleflight_coalesced_total{{group="{g.name}"}} {g.coalesced}' for g in _groups]
+    return lines
+
+metrics.register_collector(_singleflight_metrics)
@@ -0,0 +1,103 @@
+"""
+Streaming ingestion of uploaded text documents.
+
+The upload is read in fixed-size chunks and decoded incrementally as UTF-8.
+Each chunk goes through the streaming DLP masker and the windowed injection
+scanner, so the request is rejected as soon as the byte cap is exceeded or
+an injection phrase shows up, without reading the rest of the body.
+
+Memory: the raw body is never buffered whole and only one chunk of it is
+held at a time, but the masked text is accumulated, because it becomes the
+prompt the chain sends to the LLM. Per-request memory therefore grows with
+the upload, up to about the byte cap (one str copy of the masked text),
+rather than staying flat.
+"""
+import codecs, os
+from typing import Any, Dict, Optional
+from shared.processors.dlp import StreamMasker
+from shared.processors.injection import InjectionScanner
+
+MAX_UPLOAD_BYTES = int(os.getenv("SUMMARIZE_MAX_BYTES", str(1024 * 1024)))
+CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(64 * 1024)))
+
+class UploadScanner:
+    """Byte cap + incremental UTF-8 decode + DLP masking + injection scan; keeps the masked text"""
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._masker = StreamMasker()
+        self._injection = InjectionScanner()
+        self._parts = []
+
+    def feed(self, data: bytes, final: bool = False) -> Optional[str]:
+        """Consume the next chunk; returns a block reason, or None to keep going"""
+        self.nbytes += len(data)
+        if self.nbytes > self.max_bytes:
+            return "upload_too_large"
+        try:
+            text = self._decoder.decode(data, final)
+        except UnicodeDecodeError:
+            return "invalid_utf8"
+        if self._injection.feed(text):
+            return "prompt_injection_suspected"
+        self._parts.append(self._masker.feed(text))
+        return None
+
+    def finish(self) -> Optional[str]:
+        reason = self.feed(b"", final=True)
+        if reason is None:
+            self._parts.append(self._masker.flush())
+        return reason
+
+    def fields(self) -> Dict[str, Any]:
+        """Request fields for the Chain: masked prompt + sensitivity flag"""
+        return {"prompt": "".join(self._parts), "contains_sensitive": self._masker.found > 0}
+
+def _result(scanner: UploadScanner, reason: Optional[str]) -> Dict[str, Any]:
+    if reason == "upload_too_large":
+        return {"blocked": True, "reason": reason, "bytes": scanner.nbytes, "limit": scanner.max_bytes}
+    if reason:
+        return {"blocked": True, "reason": reason}
+    return scanner.fields()
+
+async def read_upload(file, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_BYTES) -> Dict[str, Any]:
+    """
+    Read an UploadFile chunk by chunk.
+
+    Returns:
+        {"prompt", "contains_sensitive"} or a {"blocked": True, "reason": ...} result
+    """
+    scanner = UploadScanner(max_bytes)
+    size = getattr(file, "size", None)
+    if size is not None and size > max_bytes:
+        scanner.nbytes = size
+        return _result(scanner, "upload_too_large")
+    while True:
+        data = await file.read(chunk_size)
+        if not data:
+            return _result(scanner, scanner.finish())
+        reason = scanner.feed(data)
+        if reason:
+            return _result(scanner, reason)
+
+def scan_bytes(data: bytes, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_BYTES) -> Dict[str, Any]:
+    """read_upload() for a document that is already in memory (e.g. a zip member)"""
+    scanner = UploadScanner(max_bytes)
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_size):
+        reason = scanner.feed(view[i:i+chunk_size])
+        if reason:
+            return _result(scanner, reason)
+    return _result(scanner, scanner.finish())
+
+def scan_file(fp, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = CHUNK_BYTES) -> Dict[str, Any]:
+    """read_upload() for a blocking binary file object (e.g. an open zip member); run it off the event loop"""
+    scanner = UploadScanner(max_bytes)
+    while True:
+        data = fp.read(chunk_size)
+        if not data:
+            return _result(scanner, scanner.finish())
+        reason = scanner.feed(data)
+        if reason:
+            return _result(scanner, reason)
@@ -0,0 +1,176 @@
+"""
+Token-bounded text chunking.
+
+Text is split into blocks at blank lines (paragraphs) and markdown-style
+headings, and blocks are packed into chunks of at most max_tokens. Besides
+the size limit, a chunk also ends after a block whose hash hits a fixed
+pattern (content-defined boundaries), so an edit in one place only changes
+the chunks around it instead of shifting every later boundary.
+
+iter_chunks() is the streaming variant for ingestion: it consumes text line
+by line, keeps each chunk's character span in the source and repeats the
+tail of every chunk at the start of the next one (overlap).
+"""
+import hashlib, re
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+CHARS_PER_TOKEN = 4  # rough estimate for English text with Llama-style tokenizers
+
+_BLOCK_SPLIT = re.compile(r"\n\s*\n|\n(?=#{1,6} )")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_HEADING = re.compile(r"#{1,6} ")
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character span of the chunk in the source text
+    end: int
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _is_heading(block: str) -> bool:
+    return block.startswith("#")
+
+def _is_boundary(block: str, divisor: int) -> bool:
+    digest = hashlib.blake2b(block.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % divisor == 0
+
+def _split_oversized(block: str, max_chars: int) -> List[str]:
+    """Sentence-pack a block that is larger than one chunk; hard-cut what is still too long"""
+    pieces, cur = [], ""
+    for sentence in _SENTENCE_SPLIT.split(block):
+        while len(sentence) > max_chars:
+            if cur:
+                pieces.append(cur)
+                cur = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if cur and len(cur) + 1 + len(sentence) > max_chars:
+            pieces.append(cur)
+            cur = ""
+        cur = f"{cur} {sentence}" if cur else sentence
+    if cur:
+        pieces.append(cur)
+    return pieces
+
+def split_text(text: str, max_tokens: int = 1500, min_tokens: int = 300, divisor: int = 4) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens (estimated).
+
+    Args:
+        max_tokens: hard upper bound per chunk
+        min_tokens: a chunk is only closed early (heading or hash boundary) once this big
+        divisor: on average every divisor-th block is a content-defined boundary
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    min_chars = min_tokens * CHARS_PER_TOKEN
+    chunks, cur = [], []
+    size = 0
+
+    def close():
+        nonlocal cur, size
+        if cur:
+            chunks.append("\n\n".join(cur))
+        cur, size = [], 0
+
+    for block in _BLOCK_SPLIT.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        if _is_heading(block) and size >= min_chars:
+            close()
+        for piece in ([block] if len(block) <= max_chars else _split_oversized(block, max_chars)):
+            if size + len(piece) + 2 > max_chars:
+                close()
+            cur.append(piece)
+            size += len(piece) + 2
+        if size >= min_chars and _is_boundary(block, divisor):
+            close()
+    close()
+    return chunks
+
+def _iter_blocks(lines: Iterable[str], max_chars: int) -> Iterator[Tuple[int, str]]:
+    """(offset, block) for the paragraphs / headings of a line stream; blocks never exceed max_chars by more than a line"""
+    pos, start, buf, size = 0, 0, [], 0
+    for line in lines:
+        blank = not line.strip()
+        if buf and (blank or _HEADING.match(line) or size >= max_chars):
+            yield start, "".join(buf)
+            buf, size = [], 0
+        if not blank:
+            if not buf:
+                start = pos
+            buf.append(line)
+            size += len(line)
+        pos += len(line)
+    if buf:
+        yield start, "".join(buf)
+
+def _cut(offset: int, block: str, max_chars: int) -> Iterator[Tuple[int, str]]:
+    """Cut an oversized block at whitespace (hard cut if there is none in the second half)"""
+    while len(block) > max_chars:
+        cut = max(block.rfind(" ", 0, max_chars), block.rfind("\n", 0, max_chars))
+        if cut < max_chars // 2:
+            cut = max_chars
+        yield offset, block[:cut]
+        offset, block = offset + cut, block[cut:]
+    yield offset, block
+
+def _tail(pieces: List[Tuple[int, str]], overlap_chars: int) -> List[Tuple[int, str]]:
+    """The last ~overlap_chars of a chunk, starting on a word boundary"""
+    out, size = [], 0
+    for offset, piece in reversed(pieces):
+        if size + len(piece) <= overlap_chars:
+            out.insert(0, (offset, piece))
+            size += len(piece)
+            continue
+        keep = piece[len(piece) - (overlap_chars - size):]
+        space = keep.find(" ")
+        if space >= 0 and keep[space + 1:].strip():
+            keep = keep[space + 1:]
+            out.insert(0, (offset + len(piece) - len(keep), keep))
+        break
+    return out
+
+def _make_chunk(pieces: List[Tuple[int, str]]) -> Chunk:
+    """Contiguous pieces are joined as they were, skipped blank lines become one paragraph break"""
+    text, end = "", None
+    for offset, piece in pieces:
+        if end is not None and offset != end:
+            text = text.rstrip() + "\n\n" + piece.lstrip("\n")
+        else:
+            text += piece
+        end = offset + len(piece)
+    first_off, first = pieces[0]
+    last_off, last = pieces[-1]
+    return Chunk(text.strip(), first_off + len(first) - len(first.lstrip()), last_off + len(last.rstrip()))
+
+def iter_chunks(lines: Iterable[str], max_tokens: int = 256, overlap_tokens: int = 32,
+                min_tokens: int = 64) -> Iterator[Chunk]:
+    """
+    Stream token-bounded, overlapping chunks out of a line iterator (e.g. an open file).
+
+    Args:
+        max_tokens: upper bound per chunk, overlap included
+        overlap_tokens: about this much of the end of a chunk is repeated at the start of the next
+        min_tokens: a heading only starts a new chunk once the current one is this big
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens, max_tokens // 2) * CHARS_PER_TOKEN
+    min_chars = min_tokens * CHARS_PER_TOKEN
+    cur: List[Tuple[int, str]] = []
+    size, fresh = 0, False  # fresh: cur holds text that has not been emitted yet
+
+    for offset, block in _iter_blocks(lines, max_chars):
+        for offset, piece in _cut(offset, block, max_chars - overlap_chars):
+            if fresh and (size + len(piece) + 1 > max_chars or (_HEADING.match(piece) and size >= min_chars)):
+                yield _make_chunk(cur)
+                cur = _tail(cur, overlap_chars)
+                size, fresh = sum(len(p) + 1 for _, p in cur), False
+            if size + len(piece) + 1 > max_chars:
+                cur, size = [], 0  # the overlap does not fit next to this piece
+            cur.append((offset, piece))
+            size += len(piece) + 1  # + paragraph break
+            fresh = True
+    if fresh:
+        yield _make_chunk(cur)
@@ -1,23 +1,121 @@
 import re
-MASKS = [
-  (re.compile(r"\b\d{16}\b"), "****-****-****-****"),     # naive card
-  (re.compile(r"\b\d{3}-\d{2}-\d{4}\b"), "***-**-****"),   # US SSN-ish
-  (re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"), "<email>"),
+from typing import List, Tuple
+from shared.gateway.gateway import stage
+
+# (detector id, pattern, replacement)
+DETECTORS = [
+  ("card", r"\b\d{16}\b", "****-****-****-****"),                           # naive card
+  ("ssn", r"\b\d{3}-\d{2}-\d{4}\b", "***-**-****"),                         # US SSN-ish
+  ("email", r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", "<email>"),
 ]
+MASKS = [(re.compile(rx), rep) for _, rx, rep in DETECTORS]
+REPLACEMENTS = {name: rep for name, _, rep in DETECTORS}
+
+# All detectors compiled into one alternation; m.lastgroup is the detector id
+_SCANNER = re.compile("|".join(f"(?P<{name}>{rx})" for name, rx, _ in DETECTORS))
+# Every match contains a digit or an '@' and lies inside one run of word
+# characters and ._%+@- so only runs containing a trigger are handed to
+# _SCANNER; the rest of the text is skipped by a C-level search.
+_TRIGGER = re.compile(r"[\d@]")
+_RUN_END = re.compile(r"[\w.%+@-]*")
+_RUN_PUNCT = set("_.%+@-")
+
+Span = Tuple[int, int, str]
+
+def scan(text: str) -> List[Span]:
+    """
+    Single pass over text with all detectors.
 
+    Returns:
+        (start, end, detector id) for each match, in order, non-overlapping
+    """
+    spans = []
+    pos = 0
+    while True:
+        m = _TRIGGER.search(text, pos)
+        if m is None:
+            return spans
+        start = m.start()
+        while start > pos and (text[start-1].isalnum() or text[start-1] in _RUN_PUNCT):
+            start -= 1
+        end = _RUN_END.match(text, m.end()).end()
+        for d in _SCANNER.finditer(text, start, end):
+            spans.append((d.start(), d.end(), d.lastgroup))
+        pos = end
+
+def redact(text: str) -> Tuple[str, int]:
+    """Mask every match in one rewrite; returns (masked text, number of matches)"""
+    spans = scan(text)
+    if not spans:
+        return text, 0
+    out, last = [], 0
+    for start, end, name in spans:
+        out.append(text[last:start])
+        out.append(REPLACEMENTS[name])
+        last = end
+    out.append(text[last:])
+    return "".join(out), len(spans)
+
+@stage(reads={"prompt", "contains_sensitive"}, writes={"prompt", "contains_sensitive"})
 def dlp_pre(req):
-    original_txt = req.get("prompt","")  # ← Save original
-    txt = original_txt
-    for rx, rep in MASKS:
-        txt = rx.sub(rep, txt)
-    req["prompt"] = txt
-    # simple sensitivity hint
-    req["contains_sensitive"] = txt != original_txt  # ← Compare to original
+    req["prompt"], found = redact(req.get("prompt",""))
+    # simple sensitivity hint; keeps a flag set by an earlier (streaming) scan of the same text
+    req["contains_sensitive"] = found > 0 or bool(req.get("contains_sensitive"))
     return req
 
+@stage(reads={"answer"}, writes={"answer"})
 def dlp_post(res):
-    out = res.get("answer", "")
-    for rx, rep in MASKS:
-        out = rx.sub(rep, out)
-    res["answer"] = out
+    res["answer"], _ = redact(res.get("answer", ""))
     return res
+
+# Every detector match is made only of these characters, so a match can never
+# straddle a character outside this set.
+_TOKEN_PUNCT = set("._%+-@")
+MAX_HOLD = 256  # longest run we hold back waiting for the next chunk
+
+def _is_token_char(c):
+    return c.isalnum() or c in _TOKEN_PUNCT
+
+class StreamMasker:
+    """
+    Incremental DLP for streamed text.
+
+    Holds back the trailing run of characters that could still grow into an
+    email, card number or SSN, and only releases text up to the last safe
+    boundary, so a match split across chunks is masked as a whole.
+    """
+    def __init__(self, max_hold: int = MAX_HOLD):
+        self.buf = ""
+        self.max_hold = max_hold
+        self.found = 0  # matches masked so far
+
+    def feed(self, chunk: str) -> str:
+        self.buf += chunk
+        cut = len(self.buf)
+        while cut > 0 and _is_token_char(self.buf[cut-1]):
+            cut -= 1
+            if len(self.buf) - cut > self.max_hold:
+                cut = len(self.buf)  # pathological run - give up holding it
+                break
+        out, self.buf = self.buf[:cut], self.buf[cut:]
+        return self._mask(out)
+
+    def flush(self) -> str:
+        out, self.buf = self.buf, ""
+        return self._mask(out)
+
+    def _mask(self, text: str) -> str:
+        out, found = redact(text)
+        self.found += found
+        return out
+
+def dlp_post_stream(chunks):
+    """Streaming counterpart of dlp_post: masks fragments as they arrive"""
+    masker = StreamMasker()
+    for chunk in chunks:
+        out = masker.feed(chunk)
+        if out:
+            yield out
+    tail = masker.flush()
+    if tail:
+        yield tail
@@ -1,14 +1,12 @@
-import re
+from shared.gateway.gateway import stage
+from shared.processors.rules import rules
 
-BAD_HINTS = [
-    r"ignore previous instructions",
-    r"disregard all",
-    r"reveal.*system prompt",
-    r"exfiltrate",
-    r"ignore all previous",
-    r"disregard.*safety",
-]
+# Hints are the "injection" rule set in shared/processors/rules.yaml
 
+# Longest injection phrase we guarantee to catch across a chunk boundary
+WINDOW_OVERLAP = 4096
+
+@stage(reads={"prompt", "context"})
 def injection_guard(req):
     """
     Detects prompt injection in user input and retrieved context.
@@ -20,20 +18,39 @@ def injection_guard(req):
     context = req.get("context", "")
     
     # Check user prompt first (strict - single pattern blocks)
-    for pattern in BAD_HINTS:
-        if re.search(pattern, prompt, re.IGNORECASE):
-            return {"blocked": True, "reason": "prompt_injection_suspected"}
+    hit = rules.first_hit(prompt, "injection")
+    if hit:
+        return _blocked(hit, "prompt")
     
     # Check retrieved context (also strict for indirect injection)
     if context:
-        context_lower = context.lower()
-        suspicious_count = sum(
-            1 for pattern in BAD_HINTS 
-            if re.search(pattern, context_lower)
-        )
-        
         # Block if ANY suspicious pattern in retrieved context (indirect injection!)
-        if suspicious_count >= 1:  # ← Changed from >= 2
-            return {"blocked": True, "reason": "prompt_injection_suspected"}
+        hit = rules.first_hit(context, "injection")
+        if hit:
+            return _blocked(hit, "context")
     
-    return req
\ No newline at end of file
+    return req
+
+def _blocked(hit, where):
+    return {"blocked": True, "reason": "prompt_injection_suspected",
+            "match": {"rule": hit.rule.id, "hint": hit.rule.pattern, "in": where,
+                      "start": hit.start, "end": hit.end}}
+class InjectionScanner:
+    """
+    Incremental injection-rule scanning for text that arrives in chunks.
+
+    Each chunk is scanned together with the last `overlap` characters of the
+    previous one, so a phrase split across chunks is still found as long as
+    the whole match is at most `overlap` characters. Literal phrases are far
+    shorter, but a `.*` rule (e.g. "reveal.*system prompt") whose match spans
+    more than `overlap` characters of one line across a chunk boundary is missed.
+    """
+    def __init__(self, overlap: int = WINDOW_OVERLAP):
+        self.overlap = overlap
+        self.tail = ""
+
+    def feed(self, chunk: str) -> bool:
+        """True as soon as any pattern matches"""
+        window = self.tail + chunk
+        self.tail = window[-self.overlap:]
+        return rules.first_hit(window, "injection") is not None
@@ -0,0 +1,143 @@
+"""
+Linear-time multi-pattern matcher for injection hints.
+
+Hints are a small regex subset:
+- literal text (punctuation may be backslash-escaped)
+- `.*`      any gap within one line
+- `[abc]`   character class (ranges like a-z allowed, no negation)
+- `x?`      optional character or class
+
+Each hint is split at `.*` into fragments, and classes/optionals are expanded
+into literal variants. All variants of all hints go into one alternation that
+is run once over the text; a small per-hint state machine strings the
+fragment hits together. The regex only ever compares literals at each
+position and the state machine does constant work per hit, so a scan is
+linear in the text length whatever the input - no backtracking on `.*`.
+"""
+import re
+from itertools import product
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+MAX_VARIANTS = 256  # per fragment, after expanding classes and optionals
+
+class Match(NamedTuple):
+    pattern: str
+    start: int
+    end: int
+
+def _parse_atoms(fragment: str, pattern: str) -> List[List[str]]:
+    """Fragment -> list of atoms, each atom a list of alternatives ('' = optional)"""
+    atoms: List[List[str]] = []
+    i = 0
+    while i < len(fragment):
+        c = fragment[i]
+        if c == "\\":
+            if i + 1 >= len(fragment) or fragment[i+1].isalnum():
+                raise ValueError(f"unsupported escape in hint: {pattern!r}")
+            atoms.append([fragment[i+1]])
+            i += 2
+        elif c == "[":
+            close = fragment.find("]", i + 1)
+            if close == -1 or fragment[i+1:i+2] == "^":
+                raise ValueError(f"unsupported character class in hint: {pattern!r}")
+            body, chars = fragment[i+1:close], []
+            j = 0
+            while j < len(body):
+                if j + 2 < len(body) and body[j+1] == "-":
+                    chars += [chr(k) for k in range(ord(body[j]), ord(body[j+2]) + 1)]
+                    j += 3
+                else:
+                    chars.append(body[j])
+                    j += 1
+            atoms.append(sorted(set(chars)))
+            i = close + 1
+        elif c == "?":
+            if not atoms or "" in atoms[-1]:
+                raise ValueError(f"misplaced '?' in hint: {pattern!r}")
+            atoms[-1] = atoms[-1] + [""]
+            i += 1
+        elif c in ".*+{}()|^$":
+            raise ValueError(f"unsupported syntax {c!r} in hint: {pattern!r}")
+        else:
+            atoms.append([c])
+            i += 1
+    return atoms
+
+def _variants(fragment: str, pattern: str, ignorecase: bool) -> List[str]:
+    atoms = _parse_atoms(fragment, pattern)
+    count = 1
+    for alts in atoms:
+        count *= len(alts)
+    if count > MAX_VARIANTS:
+        raise ValueError(f"hint expands to too many variants ({count}): {pattern!r}")
+    out = {"".join(p) for p in product(*atoms)}
+    out.discard("")
+    if not out:
+        raise ValueError(f"empty fragment in hint: {pattern!r}")
+    return sorted(v.lower() if ignorecase else v for v in out)
+
+class MultiPatternMatcher:
+    def __init__(self, patterns: List[str], ignorecase: bool = True):
+        self.patterns = list(patterns)
+        self.ignorecase = ignorecase
+        self._slots: List[int] = []  # number of fragments per pattern
+        # literal -> [(pattern index, fragment index)]
+        self._uses: Dict[str, List[Tuple[int, int]]] = {}
+        for pi, pattern in enumerate(self.patterns):
+            fragments = pattern.split(".*")
+            self._slots.append(len(fragments))
+            for fi, fragment in enumerate(fragments):
+                for lit in _variants(fragment, pattern, ignorecase):
+                    self._uses.setdefault(lit, []).append((pi, fi))
+        literals = sorted(self._uses, key=len, reverse=True)
+        # The lookahead reports the longest literal starting at each position;
+        # every other literal starting there is one of its prefixes.
+        self._implied = {lit: [p for p in literals if lit.startswith(p)] for lit in literals}
+        alternation = "(?=(" + "|".join(map(re.escape, literals)) + "))"
+        self._rx = re.compile(alternation)
+        # str.lower() can change the length of a few non-ASCII strings; those fall back to this
+        self._rx_icase = re.compile(alternation, re.IGNORECASE) if ignorecase else self._rx
+
+    def _scan(self, text: str, first_only: bool) -> List[Match]:
+        rx, haystack = self._rx, text
+        if self.ignorecase:
+            haystack = text.lower()
+            if len(haystack) != len(text):
+                rx, haystack = self._rx_icase, text
+        # per pattern: [fragments matched so far, line of the partial match, end of last fragment, start]
+        states = [[0, -1, 0, 0] for _ in self.patterns]
+        found: Dict[int, Match] = {}
+        last_pos, line = 0, -1  # line = index of the last newline before the current hit
+        for m in rx.finditer(haystack):
+            pos = m.start()
+            nl = haystack.rfind("\n", last_pos, pos)
+            if nl != -1:
+                line = nl
+            last_pos = pos
+            hit = m.group(1) if rx is self._rx else m.group(1).lower()
+            for lit in self._implied.get(hit, ()):
+                end = pos + len(lit)
+                for pi, fi in self._uses.get(lit, ()):
+                    if pi in found:
+                        continue
+                    st = states[pi]
+                    if st[0] and fi == st[0] and st[1] == line and pos >= st[2]:
+                        st[0], st[2] = st[0] + 1, end
+                    elif fi == 0 and (st[0] == 0 or st[1] != line):
+                        st[:] = [1, line, end, pos]
+                    else:
+                        continue
+                    if st[0] == self._slots[pi]:
+                        found[pi] = Match(self.patterns[pi], st[3], st[2])
+                        if first_only:
+                            return [found[pi]]
+        return sorted(found.values(), key=lambda x: x.end)
+
+    def search(self, text: str) -> Optional[Match]:
+        """First pattern to complete in text order, or None (strict mode)"""
+        hits = self._scan(text, first_only=True)
+        return hits[0] if hits else None
+
+    def findall(self, text: str) -> List[Match]:
+        """First occurrence of every pattern that matches"""
+        return self._scan(text, first_only=False)
@@ -1,15 +1,108 @@
-import os, requests, json
+import asyncio, os, json, threading
+from shared.evidence.logger import append_evidence
+from shared.gateway.gateway import stage
+from shared.gateway.http_client import get_backend
+from shared.gateway.opa_cache import cached_decision, store_decision
+from shared.gateway.singleflight import SingleFlight
+
 OPA_URL = os.getenv("OPA_URL", "http://localhost:8181/v1/data/ai/policy/allow")
 
-def policy_gate(req):
-    payload = {"input": {"user": req.get("user", {}), "request": {"intent": req.get("intent","summarize"),
-                                                                  "contains_sensitive": req.get("contains_sensitive", False)}}}
+def _opa_input(req):
+    return {"user": req.get("user", {}), "request": {"intent": req.get("intent","summarize"),
+                                                     "contains_sensitive": req.get("contains_sensitive", False)}}
+
+def _opa_allow(opa_input):
+    """(allow, decision_source): decision_source is cache | opa | opa_error"""
+    cached, epoch = cached_decision(OPA_URL, opa_input)
+    if cached is not None:
+        return cached, "cache"
     try:
-        resp = requests.post(OPA_URL, json=payload, timeout=2)
+        resp = get_backend("opa").post(OPA_URL, json={"input": opa_input}, idempotent=True)
+        resp.raise_for_status()
         allow = resp.json().get("result", False)
     except Exception:
-        allow = False
+        return False, "opa_error"  # errors fail closed and are never cached
+    store_decision(OPA_URL, opa_input, allow, epoch)
+    return allow, "opa"
+
+async def _aopa_allow(opa_input):
+    """_opa_allow for Chain.run_async; a cancelled lookup raises before anything is stored"""
+    cached, epoch = cached_decision(OPA_URL, opa_input)
+    if cached is not None:
+        return cached, "cache"
+    try:
+        resp = await get_backend("opa").apost(OPA_URL, json={"input": opa_input}, idempotent=True)
+        resp.raise_for_status()
+        allow = resp.json().get("result", False)
+    except Exception:
+        return False, "opa_error"
+    store_decision(OPA_URL, opa_input, allow, epoch)
+    return allow, "opa"
+
+def _apply(req, opa_input, allow, source):
+    """Deny decisions are written to evidence whether they came from OPA or the cache"""
     if not allow:
+        append_evidence({
+            "type": "policy_denied",
+            "input": opa_input,
+            "decision_source": source
+        })
         req["_blocked"] = True
         req["_reason"] = "policy_denied"
-    return req
\ No newline at end of file
+    return req
+
+@stage(reads={"user", "intent", "contains_sensitive"}, writes={"_blocked", "_reason"})
+def policy_gate(req):
+    opa_input = _opa_input(req)
+    return _apply(req, opa_input, *_opa_allow(opa_input))
+
+async def _apolicy_gate(req):
+    opa_input = _opa_input(req)
+    return _apply(req, opa_input, *await _aopa_allow(opa_input))
+
+# run_async awaits this instead, so a stage cancelled by an earlier block writes no evidence
+policy_gate.aio = _apolicy_gate
+
+# Batch workers asking for the same input at once share one OPA round-trip
+_batch_flight = SingleFlight("opa_batch")
+
+def memoized_policy_gate():
+    """
+    policy_gate for batch jobs: one OPA decision per distinct
+    (user attributes, intent, contains_sensitive) for the lifetime of the
+    returned processor. Create one per batch so policy changes apply to the next batch.
+    Fail-closed errors are not memoized, so the next document asks OPA again.
+    """
+    decisions = {}
+    lock = threading.Lock()
+
+    @stage(reads={"user", "intent", "contains_sensitive"}, writes={"_blocked", "_reason"})
+    def policy_gate(req):
+        opa_input = _opa_input(req)
+        key = json.dumps(opa_input, sort_keys=True)
+        with lock:
+            memo = decisions.get(key)
+        if memo is not None:
+            return _apply(req, opa_input, memo, "batch")
+        # OPA is asked outside the lock, so distinct inputs are looked up in parallel
+        allow, source = _batch_flight.do(key, lambda: _opa_allow(opa_input))
+        return _remember(req, opa_input, key, allow, source)
+
+    async def apolicy_gate(req):
+        opa_input = _opa_input(req)
+        key = json.dumps(opa_input, sort_keys=True)
+        with lock:
+            memo = decisions.get(key)
+        if memo is not None:
+            return _apply(req, opa_input, memo, "batch")
+        allow, source = await asyncio.to_thread(_batch_flight.do, key, lambda: _opa_allow(opa_input))
+        return _remember(req, opa_input, key, allow, source)
+
+    def _remember(req, opa_input, key, allow, source):
+        if source in ("opa", "cache"):
+            with lock:
+                decisions[key] = allow
+        return _apply(req, opa_input, allow, source)
+
+    policy_gate.aio = apolicy_gate
+    return policy_gate
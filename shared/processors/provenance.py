@@ -1,3 +1,6 @@
+from shared.gateway.gateway import stage
+
+@stage(writes={"provenance"})
 def add_provenance(res):
     res["provenance"] = {"policy":"OPA v1","dlp":"basic_masks_v1"}
     return res
@@ -0,0 +1,170 @@
+"""
+Shared pattern-rule engine for all guardrails.
+
+Rule sets (injection, ingest_validation, exfiltration, context_risk, ...)
+live in a versioned YAML file. All rules of all sets are compiled once into
+a single MultiPatternMatcher, so a text is scanned once and the caller gets
+every matching rule across every set. Results for recently scanned texts are
+kept in a small LRU, so a payload that passes through several guards is only
+scanned by the first one.
+
+Guards that only need a verdict use first_hit(): it runs the matcher of one
+set and stops at the first match, so a blocked payload is not scanned to the
+end and a clean one is not checked against every other set. scan() is for
+callers that report or count every hit.
+
+The file is re-read when its mtime changes (checked at most every
+RULES_RELOAD_INTERVAL seconds); a broken edit keeps the previous rules.
+"""
+import hashlib, os, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+import yaml
+from shared.processors.matcher import MultiPatternMatcher
+
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(os.path.dirname(__file__), "rules.yaml"))
+
+class Rule(NamedTuple):
+    id: str
+    set: str
+    pattern: str
+    category: str
+    weight: int
+
+class RuleHit(NamedTuple):
+    rule: Rule
+    start: int
+    end: int
+
+class ScanResult:
+    def __init__(self, revision: str, hits: List[RuleHit]):
+        self.revision = revision
+        self._by_set: Dict[str, List[RuleHit]] = {}
+        for h in hits:
+            self._by_set.setdefault(h.rule.set, []).append(h)
+
+    def hits(self, rule_set: str) -> List[RuleHit]:
+        """Matching rules of one set, in text order"""
+        return self._by_set.get(rule_set, [])
+
+    def first(self, rule_set: str) -> Optional[RuleHit]:
+        hits = self.hits(rule_set)
+        return hits[0] if hits else None
+
+    def score(self, rule_set: str) -> int:
+        return sum(h.rule.weight for h in self.hits(rule_set))
+
+class _Compiled:
+    def __init__(self, version: Any, fingerprint: str, rules: List[Rule]):
+        self.version = version
+        self.revision = f"{version}:{fingerprint}"
+        self.rules = rules
+        self.by_pattern: Dict[str, List[Rule]] = {}
+        for r in rules:
+            self.by_pattern.setdefault(r.pattern, []).append(r)
+        self.matcher = MultiPatternMatcher(list(self.by_pattern))
+        self.set_matchers: Dict[str, MultiPatternMatcher] = {}
+        for set_name in {r.set for r in rules}:
+            patterns = list(dict.fromkeys(r.pattern for r in rules if r.set == set_name))
+            self.set_matchers[set_name] = MultiPatternMatcher(patterns)
+
+def _compile(raw: bytes) -> _Compiled:
+    data = yaml.safe_load(raw) or {}
+    rules = []
+    for set_name, entries in (data.get("rule_sets") or {}).items():
+        for e in entries or []:
+            rules.append(Rule(id=e["id"], set=set_name, pattern=e["pattern"],
+                              category=e.get("category", set_name), weight=int(e.get("weight", 1))))
+    return _Compiled(data.get("version", 0), hashlib.sha256(raw).hexdigest()[:12], rules)
+
+class RuleEngine:
+    def __init__(self, path: str = RULES_PATH, reload_interval_s: float = 2.0,
+                 cache_entries: int = 256, cache_max_chars: int = 64 * 1024):
+        self.path = path
+        self.reload_interval_s = reload_interval_s
+        self.cache_entries = cache_entries
+        self.cache_max_chars = cache_max_chars
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, ScanResult]" = OrderedDict()
+        self._mtime = os.stat(path).st_mtime
+        self._checked = time.monotonic()
+        with open(path, "rb") as f:
+            self._compiled = _compile(f.read())
+
+    @classmethod
+    def from_env(cls) -> "RuleEngine":
+        return cls(RULES_PATH, reload_interval_s=float(os.getenv("RULES_RELOAD_INTERVAL", "2")))
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval_s:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime  # a broken edit is reported once, not on every check
+        try:
+            with open(self.path, "rb") as f:
+                compiled = _compile(f.read())
+        except Exception as e:
+            print(f"[Rules] Reload of {self.path} failed, keeping revision {self._compiled.revision}: {e}")
+            return
+        with self._lock:
+            self._compiled = compiled
+            self._cache.clear()
+        print(f"[Rules] Loaded revision {compiled.revision} ({len(compiled.rules)} rules)")
+
+    @property
+    def revision(self) -> str:
+        """Rule file version plus content hash - changes whenever any rule changes"""
+        self._maybe_reload()
+        return self._compiled.revision
+
+    def rules(self, rule_set: str) -> List[Rule]:
+        self._maybe_reload()
+        return [r for r in self._compiled.rules if r.set == rule_set]
+
+    def first_hit(self, text: str, rule_set: str) -> Optional[RuleHit]:
+        """First rule of one set to match in text order (same as scan(text).first(rule_set)), or None"""
+        self._maybe_reload()
+        compiled = self._compiled
+        if len(text) <= self.cache_max_chars:
+            with self._lock:
+                cached = self._cache.get(text)
+            if cached is not None and cached.revision == compiled.revision:
+                return cached.first(rule_set)
+        matcher = compiled.set_matchers.get(rule_set)
+        m = matcher.search(text) if matcher is not None else None
+        if m is None:
+            return None
+        rule = next(r for r in compiled.by_pattern[m.pattern] if r.set == rule_set)
+        return RuleHit(rule, m.start, m.end)
+
+    def scan(self, text: str) -> ScanResult:
+        """Every matching rule across all sets, from a single pass over text"""
+        self._maybe_reload()
+        compiled = self._compiled
+        cacheable = len(text) <= self.cache_max_chars
+        if cacheable:
+            with self._lock:
+                cached = self._cache.get(text)
+                if cached is not None and cached.revision == compiled.revision:
+                    self._cache.move_to_end(text)
+                    return cached
+        hits = [RuleHit(rule, m.start, m.end)
+                for m in compiled.matcher.findall(text)
+                for rule in compiled.by_pattern[m.pattern]]
+        hits.sort(key=lambda h: h.end)
+        result = ScanResult(compiled.revision, hits)
+        if cacheable:
+            with self._lock:
+                self._cache[text] = result
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return result
+
+rules = RuleEngine.from_env()
@@ -0,0 +1,88 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are stored in SQLite as float32 blobs keyed by sha256(text), so an
+unchanged corpus is re-ingested after a restart without a single call to
+Ollama, and repeated questions are embedded once.
+- the embedding model is recorded in a meta table; opening the cache with a
+  different EMB_MODEL wipes it (vectors of different models never mix)
+- total blob bytes are bounded by max_bytes, least recently used go first
+"""
+import hashlib, os, sqlite3, threading, time
+from array import array
+from typing import Dict, List, Optional
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, path: str, model: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.model = model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                             "key TEXT PRIMARY KEY, vec BLOB, size INTEGER, atime REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_atime ON embeddings(atime)")
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+            if row is None or row[0] != model:
+                if row is not None:
+                    print(f"[EmbedCache] Model changed ({row[0]} -> {model}), dropping cached embeddings")
+                self._db.execute("DELETE FROM embeddings")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (model,))
+
+    @classmethod
+    def from_env(cls, model: str) -> Optional["EmbeddingCache"]:
+        if os.getenv("EMBED_CACHE", "sqlite").lower() != "sqlite":
+            return None
+        return cls(os.getenv("EMBED_CACHE_PATH", "./cache/embeddings.sqlite"), model,
+                   max_bytes=int(os.getenv("EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+
+    def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        """text -> cached vector, for the texts that are cached"""
+        keys = {text_key(t): t for t in texts}
+        found: Dict[str, List[float]] = {}
+        with self._lock, self._db:
+            for k in keys:
+                row = self._db.execute("SELECT vec FROM embeddings WHERE key = ?", (k,)).fetchone()
+                if row is not None:
+                    found[keys[k]] = array("f", row[0]).tolist()
+            now = time.time()
+            self._db.executemany("UPDATE embeddings SET atime = ? WHERE key = ?",
+                                 [(now, text_key(t)) for t in found])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for text, vec in items.items():
+            blob = array("f", vec).tobytes()
+            rows.append((text_key(text), blob, len(blob), now))
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, old_size in self._db.execute(
+                    "SELECT key, size FROM embeddings ORDER BY atime").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM embeddings WHERE key = ?", (old_key,))
+                total -= old_size
+                self.evictions += 1
+
+    def prometheus_lines(self):
+        return [
+            "# TYPE embed_cache_hits_total counter", f"embed_cache_hits_total {self.hits}",
+            "# TYPE embed_cache_misses_total counter", f"embed_cache_misses_total {self.misses}",
+            "# TYPE embed_cache_evictions_total counter", f"embed_cache_evictions_total {self.evictions}",
+        ]
@@ -0,0 +1,220 @@
+"""
+Staged, bounded-memory ingest pipeline.
+
+    files -> [read x R] -> chunks -> [batch] -> [embed x E] -> [write x W]
+
+Each arrow is a bounded queue, so a slow stage blocks the ones before it
+(backpressure) and at most ~queue_batches batches per stage are in memory
+however large the corpus is. Every written batch is committed on its own:
+after each write the on_commit callback sees which chunks of which files are
+in the store (store_chroma uses it to checkpoint the sync manifest). After an
+interruption, fully committed files are skipped; a partly written file is
+read and chunked again, but its chunks that were already committed are not
+re-embedded or rewritten (store_chroma's prepare() leaves them out).
+
+If any stage fails, the other stages drain their queues without doing work,
+the pipeline stops, and run() re-raises the first error.
+"""
+import os, queue, resource, threading
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+INGEST_BATCH = int(os.getenv("RAG_INGEST_BATCH", "64"))
+INGEST_READ_WORKERS = int(os.getenv("RAG_INGEST_READ_WORKERS", "2"))
+INGEST_EMBED_WORKERS = int(os.getenv("RAG_INGEST_EMBED_WORKERS", "2"))
+INGEST_WRITE_WORKERS = int(os.getenv("RAG_INGEST_WRITE_WORKERS", "1"))
+INGEST_QUEUE_BATCHES = int(os.getenv("RAG_INGEST_QUEUE_BATCHES", "4"))
+
+_DONE = object()
+
+# (chunk id, text, metadata)
+ChunkRecord = Tuple[str, str, Dict[str, Any]]
+
+class IngestJob:
+    """One file. prepare() fills sha256 / reason (and may settle status); the pipeline tracks its chunks."""
+    def __init__(self, path: str, validate: bool, prev: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.validate = validate
+        self.prev = prev
+        self.sha256: Optional[str] = None
+        self.reason: Optional[str] = None
+        self.status = "pending"  # pending | ingested | rejected, or whatever prepare() sets
+        self.committed: List[str] = []
+        self._pending = 0
+        self._read_done = False
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+class IngestPipeline:
+    def __init__(self, collection, embed: Callable[[List[str]], List[List[float]]],
+                 prepare: Callable[[IngestJob], Optional[Iterator[ChunkRecord]]],
+                 on_commit: Optional[Callable[[List[IngestJob]], None]] = None,
+                 batch_size: int = INGEST_BATCH, read_workers: int = INGEST_READ_WORKERS,
+                 embed_workers: int = INGEST_EMBED_WORKERS, write_workers: int = INGEST_WRITE_WORKERS,
+                 queue_batches: int = INGEST_QUEUE_BATCHES):
+        """
+        Args:
+            prepare: job -> chunk records of the file, or None if there is nothing to write
+                     (status "rejected" unless prepare() set another one)
+            on_commit: called (serialized) with the jobs touched by every committed batch
+                       and by every rejected or empty file
+        """
+        self.collection = collection
+        self.embed = embed
+        self.prepare = prepare
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.read_workers = max(1, read_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.write_workers = max(1, write_workers)
+        self.queue_batches = max(1, queue_batches)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self.chunks_written = 0
+        self.batches_written = 0
+
+    def _fail(self, e: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = e
+
+    def _commit(self, jobs: List[IngestJob]):
+        if self.on_commit is not None:
+            self.on_commit(jobs)
+
+    def _finish_if_complete(self, job: IngestJob) -> bool:
+        # caller holds self._lock
+        if job._read_done and job._pending == 0 and job.status == "pending":
+            job.status = "ingested"
+            return True
+        return False
+
+    # Stages -----------------------------------------------------------------
+
+    def _read(self, jobs: "queue.Queue", out: "queue.Queue"):
+        while True:
+            job = jobs.get()
+            if job is _DONE:
+                return
+            if self._error is not None:
+                continue
+            try:
+                records = self.prepare(job)
+                if records is None:
+                    with self._lock:
+                        if job.status == "pending":
+                            job.status = "rejected"
+                        self._commit([job])
+                    continue
+                for record in records:
+                    if self._error is not None:
+                        break
+                    with self._lock:
+                        job._pending += 1
+                    out.put((job, record))  # blocks while downstream is full
+                else:
+                    with self._lock:
+                        job._read_done = True
+                        if self._finish_if_complete(job):
+                            self._commit([job])
+            except BaseException as e:
+                self._fail(e)
+
+    def _batch(self, chunks: "queue.Queue", out: "queue.Queue"):
+        batch = []
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                out.put(batch)
+                batch = []
+        if batch:
+            out.put(batch)
+
+    def _embed(self, batches: "queue.Queue", out: "queue.Queue"):
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                return
+            if self._error is not None:
+                continue
+            try:
+                out.put((batch, self.embed([text for _, (_, text, _) in batch])))
+            except BaseException as e:
+                self._fail(e)
+
+    def _write(self, embedded: "queue.Queue"):
+        while True:
+            item = embedded.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                continue
+            batch, embeddings = item
+            try:
+                self.collection.upsert(
+                    ids=[cid for _, (cid, _, _) in batch],
+                    documents=[text for _, (_, text, _) in batch],
+                    metadatas=[meta for _, (_, _, meta) in batch],
+                    embeddings=embeddings  # type: ignore
+                )
+                with self._lock:
+                    touched = []
+                    for job, (cid, _, _) in batch:
+                        job.committed.append(cid)
+                        job._pending -= 1
+                        if job not in touched:
+                            touched.append(job)
+                    for job in touched:
+                        self._finish_if_complete(job)
+                    self.chunks_written += len(batch)
+                    self.batches_written += 1
+                    self._commit(touched)
+            except BaseException as e:
+                self._fail(e)
+
+    # ------------------------------------------------------------------------
+
+    def run(self, jobs: List[IngestJob]) -> Dict[str, Any]:
+        t0 = perf_counter()
+        job_q: "queue.Queue" = queue.Queue()
+        chunk_q: "queue.Queue" = queue.Queue(maxsize=self.batch_size * self.queue_batches)
+        batch_q: "queue.Queue" = queue.Queue(maxsize=self.queue_batches)
+        write_q: "queue.Queue" = queue.Queue(maxsize=self.queue_batches)
+        for job in jobs:
+            job_q.put(job)
+
+        def start(n, target, *args):
+            threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(n)]
+            for t in threads:
+                t.start()
+            return threads
+
+        readers = start(self.read_workers, self._read, job_q, chunk_q)
+        batcher = start(1, self._batch, chunk_q, batch_q)
+        embedders = start(self.embed_workers, self._embed, batch_q, write_q)
+        writers = start(self.write_workers, self._write, write_q)
+
+        # Shut the stages down in order: each sees _DONE once everything before it has finished
+        for stage, q, n in ((readers, job_q, self.read_workers), (batcher, chunk_q, 1),
+                            (embedders, batch_q, self.embed_workers), (writers, write_q, self.write_workers)):
+            for _ in range(n):
+                q.put(_DONE)
+            for t in stage:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
+        elapsed = perf_counter() - t0
+        files = sum(1 for j in jobs if j.status == "ingested")
+        return {
+            "files_ingested": files,
+            "chunks_written": self.chunks_written,
+            "batches_written": self.batches_written,
+            "docs_per_s": round(files / elapsed, 1) if elapsed > 0 else 0.0,
+            "chunks_per_s": round(self.chunks_written / elapsed, 1) if elapsed > 0 else 0.0,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
@@ -1,20 +1,92 @@
-import os, requests
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from typing import List
+from shared.gateway import metrics
+from shared.gateway.http_client import get_backend
+from shared.gateway.singleflight import SingleFlight
+from shared.rag.embed_cache import EmbeddingCache
 
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 EMB_MODEL = os.getenv("EMB_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings for a list of texts using Ollama"""
-    out = []
-    for t in texts:
-        r = requests.post(f"{OLLAMA_URL}/api/embeddings",
-                          json={"model": EMB_MODEL, "prompt": t},
-                          timeout=120)
-        r.raise_for_status()
-        out.append(r.json()["embedding"])
+# Persistent cache (EMBED_CACHE=sqlite|off), wiped when EMB_MODEL changes
+_cache = EmbeddingCache.from_env(EMB_MODEL)
+if _cache is not None:
+    metrics.register_collector(_cache.prometheus_lines)
+
+# Identical concurrent embedding requests share one backend call
+_flight = SingleFlight("embed")
+
+# Flipped off the first time the server has no /api/embed (older Ollama)
+_batch_supported = True
+
+def _normalize(v: List[float]) -> List[float]:
+    # /api/embed returns unit vectors; keep fallback vectors comparable with them
+    n = math.sqrt(sum(x * x for x in v))
+    return [x / n for x in v] if n else v
+
+def _endpoint_missing(r) -> bool:
+    """
+    A 404 for a missing route (plain "404 page not found") rather than Ollama's
+    JSON error for a model that has not been pulled yet
+    """
+    if r.status_code != 404:
+        return False
+    try:
+        return "error" not in r.json()
+    except ValueError:
+        return True
+
+def _embed_one(t: str) -> List[float]:
+    r = get_backend("ollama_embed").post("/api/embeddings",
+                                         json={"model": EMB_MODEL, "prompt": t},
+                                         idempotent=True)
+    r.raise_for_status()
+    return _normalize(r.json()["embedding"])
+
+def _embed_batch(batch: List[str]) -> List[List[float]]:
+    global _batch_supported
+    t0 = perf_counter()
+    out = None
+    if _batch_supported:
+        r = get_backend("ollama_embed").post("/api/embed",
+                                             json={"model": EMB_MODEL, "input": batch},
+                                             idempotent=True)
+        if _endpoint_missing(r):
+            print("[Embed] /api/embed not available, falling back to per-text /api/embeddings")
+            _batch_supported = False
+        else:
+            r.raise_for_status()
+            out = r.json()["embeddings"]
+    if out is None:
+        out = [_embed_one(t) for t in batch]
+    metrics.observe("embed", "batch", (perf_counter()-t0)*1000)
     return out
 
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    batches = [texts[i:i+EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    if len(batches) <= 1:
+        return _embed_batch(batches[0]) if batches else []
+    with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as pool:
+        # map() yields results in input order
+        return [emb for batch in pool.map(_embed_batch, batches) for emb in batch]
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Generate embeddings for a list of texts using Ollama (cached, batched, order preserved)"""
+    if _cache is None:
+        return _flight.do((EMB_MODEL, tuple(texts)), lambda: _embed_uncached(texts))
+    found = _cache.get_many(texts)
+    missing = list(dict.fromkeys(t for t in texts if t not in found))
+    if missing:
+        fresh = _flight.do((EMB_MODEL, tuple(missing)), lambda: _embed_uncached(missing))
+        new = dict(zip(missing, fresh))
+        _cache.put_many(new)
+        found.update(new)
+    return [found[t] for t in texts]
+
 def embed_text(text: str) -> List[float]:
     """Generate embedding for a single text"""
-    return embed_texts([text])[0]
\ No newline at end of file
+    return embed_texts([text])[0]
@@ -1,54 +1,61 @@
-import os, uuid, glob
-from typing import List, Dict, Optional, Any
-import chromadb
+import os, glob, hashlib, json, threading
+from collections import Counter, OrderedDict
+from time import perf_counter
+from typing import List, Dict, Optional, Any, Callable, Iterator, Tuple
 from .ollama_embed import embed_texts
+from .vector_store import VectorStore, build_vector_store
+from shared.gateway import metrics
+from shared.gateway.cache import normalize_prompt
+from shared.gateway.singleflight import SingleFlight
+from shared.processors.chunking import Chunk, iter_chunks
+from shared.rag.ingest_pipeline import ChunkRecord, IngestJob, IngestPipeline
+from shared.processors.rules import rules
 
-# Chroma client with persistent storage
+# Vector store backend (chroma | numpy, see shared/rag/vector_store.py), created on first use
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
 CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_data")
-_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", CHROMA_DB_PATH if VECTOR_STORE == "chroma" else "./vector_data")
 _collection_name = os.getenv("RAG_COLLECTION", "lab02_docs")
-_collection: Optional[Any] = None
-
-# Content validation patterns (same as injection guard)
-SUSPICIOUS_PATTERNS = [
-    r"ignore previous instructions",
-    r"disregard all",
-    r"reveal.*system prompt",
-    r"exfiltrate",
-    r"ignore all previous",
-    r"disregard.*safety",
-]
-
-def get_collection():
+_collection: Optional[VectorStore] = None
+
+# Documents are stored as token-bounded, overlapping chunks
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "32"))
+READ_CHARS = 16 * 1024  # files are streamed in pieces of at most this many characters
+
+# What sync_folders() last did with each file: path -> size, mtime, content hash,
+# validation rules fingerprint, status (ingested | rejected), chunk ids
+RAG_MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH",
+                              os.path.join(VECTOR_STORE_PATH, f"{_collection_name}_manifest.json"))
+MANIFEST_VERSION = 3
+
+# Bumped on every write to the collection; part of the retrieval cache key
+_collection_version = 0
+
+def _bump_version():
+    global _collection_version
+    _collection_version += 1
+
+def get_collection() -> VectorStore:
     """Get or create the collection"""
     global _collection
     if _collection is None:
-        _collection = _client.get_or_create_collection(name=_collection_name)
+        _collection = build_vector_store(VECTOR_STORE, VECTOR_STORE_PATH, _collection_name)
     return _collection
 
-def reset_collection():
+def reset_collection() -> VectorStore:
     """Reset the collection - delete and recreate"""
-    global _collection
-    try:
-        _client.delete_collection(_collection_name)
-    except Exception:
-        pass
-    _collection = _client.get_or_create_collection(name=_collection_name)
-    return _collection
+    collection = get_collection()
+    collection.reset()
+    _bump_version()
+    for path in (RAG_MANIFEST_PATH, _journal_path()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return collection
 
-def validate_document(text: str, source_path: str) -> tuple[bool, str]:
-    """
-    Validate document before ingestion.
-    Returns (is_valid, reason)
-    """
-    import re
-    
-    # Count suspicious patterns
-    suspicious_count = sum(
-        1 for pattern in SUSPICIOUS_PATTERNS 
-        if re.search(pattern, text, re.IGNORECASE)
-    )
-    
+def _validation_verdict(suspicious_count: int, source_path: str) -> tuple[bool, str]:
     # Allow documents from redteam folder (for testing)
     if "redteam" in source_path or "ipi_pages" in source_path:
         return True, "redteam_document"
@@ -59,83 +66,400 @@ def validate_document(text: str, source_path: str) -> tuple[bool, str]:
     
     return True, "accepted"
 
-def add_docs_from_folder(folder: str, validate: bool = True) -> int:
+def validate_document(text: str, source_path: str) -> tuple[bool, str]:
+    """
+    Validate document before ingestion.
+    Returns (is_valid, reason)
+    """
+    # Count suspicious patterns ("ingest_validation" rules in shared/processors/rules.yaml)
+    return _validation_verdict(len(rules.scan(text).hits("ingest_validation")), source_path)
+
+def validation_fingerprint() -> str:
+    """Changes whenever the ingest_validation rules do (rules.yaml is hot-reloaded)"""
+    ruleset = json.dumps([list(r) for r in rules.rules("ingest_validation")])
+    return hashlib.sha256(ruleset.encode("utf-8")).hexdigest()[:12]
+
+def _prescan(path: str) -> Tuple[int, str]:
+    """
+    One streaming pass over a file: ingest_validation hit count + sha256 of the content.
+    Rules never match across a line break, so scanning whole lines in groups
+    finds every rule validate_document() finds on the full text. Like there,
+    each rule counts once however many groups it matches in.
+    """
+    h = hashlib.sha256()
+    matched, buf, size = set(), [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            h.update(line.encode("utf-8"))
+            buf.append(line)
+            size += len(line)
+            if size >= READ_CHARS:
+                matched.update(hit.rule.id for hit in rules.scan("".join(buf)).hits("ingest_validation"))
+                buf, size = [], 0
+    if buf:
+        matched.update(hit.rule.id for hit in rules.scan("".join(buf)).hits("ingest_validation"))
+    return len(matched), h.hexdigest()
+
+# Ingest-time annotations are stored in chunk metadata under this prefix
+ANNOTATION_PREFIX = "sec_"
+
+def doc_id(path: str, content_sha256: str) -> str:
+    """Stable document ID: same file + same content = same ID, any edit = new ID"""
+    return hashlib.sha256(f"{path}\0{content_sha256}".encode("utf-8")).hexdigest()[:32]
+
+def _list_docs(folder: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(folder, "*.md"))) + \
+           sorted(glob.glob(os.path.join(folder, "*.txt")))
+
+def _read_chunks(path: str) -> Iterator[Chunk]:
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_chunks(iter(lambda: f.readline(READ_CHARS), ""),
+                               max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+def _chunk_metadata(path: str, index: int, chunk: Chunk,
+                    annotate: Optional[Callable[[str], Dict[str, Any]]]) -> Dict[str, Any]:
+    m = {
+        "source_path": path,
+        "trust_level": "redteam" if "redteam" in path else "internal",
+        "chunk_index": index,
+        "start": chunk.start,
+        "end": chunk.end,
+    }
+    if annotate is not None:
+        m.update({ANNOTATION_PREFIX + k: v for k, v in annotate(chunk.text).items()})
+    return m
+
+def _same_verdict(prev: Dict[str, Any], validate: bool, fingerprint: str) -> bool:
+    """prev was validated the same way, under the same ingest_validation rules"""
+    return prev["validated"] == validate and (not validate or prev["rules"] == fingerprint)
+
+def _prepare(job: IngestJob, annotate: Optional[Callable[[str], Dict[str, Any]]],
+             fingerprint: str = "") -> Optional[Iterator[ChunkRecord]]:
+    """Read stage of the ingest pipeline: prescan + validation, then the file's chunk stream"""
+    suspicious_count, job.sha256 = _prescan(job.path)
+    prev = job.prev
+    same_content = bool(prev) and prev["validated"] == job.validate and prev["sha256"] == job.sha256
+    if same_content and _same_verdict(prev, job.validate, fingerprint):
+        job.status = prev["status"]  # touched, not changed: stays ingested (unchanged) or rejected
+        if job.status == "ingested":
+            job.status = "unchanged"
+        return None
+    if job.validate:
+        is_valid, job.reason = _validation_verdict(suspicious_count, job.path)
+        if not is_valid:
+            print(f"⚠️  Rejected: {job.path} ({job.reason})")
+            return None
+    if same_content and prev["status"] == "ingested":
+        job.status = "unchanged"  # revalidated under new rules and still accepted: nothing to re-embed
+        return None
+    did = doc_id(job.path, job.sha256)
+    done = set()
+    if prev and prev["status"] == "partial":
+        # Interrupted ingest of this same content: its committed chunks are kept, not re-embedded
+        done = {cid for cid in prev["ids"] if cid.startswith(did + ":")}
+        job.committed.extend(sorted(done))
+    return ((f"{did}:{i}", chunk.text, _chunk_metadata(job.path, i, chunk, annotate))
+            for i, chunk in enumerate(_read_chunks(job.path)) if f"{did}:{i}" not in done)
+
+def _pipeline(collection, annotate: Optional[Callable[[str], Dict[str, Any]]],
+              on_commit: Callable[[List[IngestJob]], None], fingerprint: str = "") -> IngestPipeline:
+    return IngestPipeline(collection, embed=embed_texts,
+                          prepare=lambda job: _prepare(job, annotate, fingerprint), on_commit=on_commit)
+
+def add_docs_from_folder(folder: str, validate: bool = True,
+                         annotate: Optional[Callable[[str], Dict[str, Any]]] = None) -> int:
     """
     Add documents from folder with optional validation.
     
     Args:
         folder: Path to folder containing documents
         validate: If True, validate documents before ingestion (default: True)
+        annotate: Optional text -> flat dict of str/int/float/bool, stored with
+                  each chunk and returned by query() as hit["annotation"]
     
     Returns:
         Number of documents successfully added
     """
-    paths = sorted(glob.glob(os.path.join(folder, "*.md"))) + \
-            sorted(glob.glob(os.path.join(folder, "*.txt")))
+    paths = _list_docs(folder)
     
     if not paths:
         return 0
     
-    ids, docs, meta = [], [], []
-    rejected = []
-    
-    for p in paths:
-        with open(p, "r", encoding="utf-8") as f:
-            txt = f.read()
-        
-        # Validate if enabled
-        if validate:
-            is_valid, reason = validate_document(txt, p)
-            if not is_valid:
-                rejected.append((p, reason))
-                print(f"⚠️  Rejected: {p} ({reason})")
-                continue  # Skip this document
-        
-        did = str(uuid.uuid4())
-        ids.append(did)
-        docs.append(txt)
-        meta.append({
-            "source_path": p,
-            "trust_level": "redteam" if "redteam" in p else "internal"
-        })
-    
-    if not docs:
-        return 0
+    jobs = [IngestJob(p, validate) for p in paths]
+    _pipeline(get_collection(), annotate, on_commit=lambda touched: _bump_version()).run(jobs)
+    
+    rejected = [j for j in jobs if j.status == "rejected"]
+    if rejected:
+        print(f"⚠️  Total rejected: {len(rejected)} documents")
+    
+    return sum(1 for j in jobs if j.status == "ingested" and j.committed)
+
+def _journal_path() -> str:
+    return RAG_MANIFEST_PATH + ".journal"
+
+def _apply(files: Dict[str, Dict[str, Any]], record: Dict[str, Any]):
+    """Apply one journal record: a file's final entry (None = removed) or newly committed chunk ids"""
+    path = record["path"]
+    if "entry" in record:
+        if record["entry"] is None:
+            files.pop(path, None)
+        else:
+            files[path] = record["entry"]
+        return
+    # Partly written: never matches on the next run, so the file is picked up again; chunks of
+    # the same content already committed are skipped, anything else is cleaned up
+    old = files.get(path)
+    ids = old["ids"] if old else []
+    new = old is None or (old["status"] == "partial" and old["new"]) or not ids
+    files[path] = {"size": -1, "mtime": -1, "validated": record["validated"], "sha256": "",
+                   "rules": "", "status": "partial", "new": new, "ids": sorted(set(ids) | set(record["add"]))}
+
+def _load_manifest() -> Dict[str, Dict[str, Any]]:
+    """Last snapshot plus the journal of batches committed since"""
+    files: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(RAG_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("collection") == _collection_name and data.get("version") == MANIFEST_VERSION:
+            files = data.get("files", {})
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(_journal_path(), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    _apply(files, json.loads(line))
+                except ValueError:
+                    break  # torn last line of an interrupted run
+    except OSError:
+        pass
+    return files
+
+def _write_journal(records: List[Dict[str, Any]]):
+    os.makedirs(os.path.dirname(os.path.abspath(RAG_MANIFEST_PATH)), exist_ok=True)
+    with open(_journal_path(), "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+def _save_manifest(files: Dict[str, Dict[str, Any]]):
+    """Snapshot; the journal is folded into it"""
+    os.makedirs(os.path.dirname(os.path.abspath(RAG_MANIFEST_PATH)), exist_ok=True)
+    tmp = RAG_MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "collection": _collection_name, "files": files},
+                  f, indent=1, sort_keys=True)
+    os.replace(tmp, RAG_MANIFEST_PATH)
+    try:
+        os.remove(_journal_path())
+    except FileNotFoundError:
+        pass
+
+def sync_folders(folders: Dict[str, bool],
+                 annotate: Optional[Callable[[str], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Incrementally bring the collection in line with the documents in `folders`.
+    
+    Args:
+        folders: folder -> validate flag (as for add_docs_from_folder). Documents
+                 of folders that are not listed are removed from the collection.
+        annotate: as for add_docs_from_folder
     
-    embeddings = embed_texts(docs)
+    Files whose size + mtime (or, failing that, content hash) match the manifest
+    are skipped without being chunked or embedded, unless the ingest_validation
+    rules changed since they were validated: then they are revalidated, so a
+    file can become accepted or rejected without being edited. New and changed
+    files are upserted; chunks of removed, rejected or replaced files are deleted.
     
+    Returns:
+        Counts of added / updated / removed / rejected / unchanged files
+        (a file that stays rejected counts as rejected, not unchanged)
+    """
+    t0 = perf_counter()
     collection = get_collection()
-    collection.add(
-        documents=docs, 
-        metadatas=meta, 
-        embeddings=embeddings,  # type: ignore
-        ids=ids
-    )
+    old = _load_manifest()
+    if collection.count() != sum(len(e["ids"]) for e in old.values()):
+        # Collection and manifest disagree (first run, wiped DB, ...) - rebuild from scratch
+        if old or collection.count():
+            print(f"[RAG] Manifest does not match collection {_collection_name}, re-ingesting everything")
+        collection = reset_collection()
+        old = {}
     
-    if rejected:
-        print(f"⚠️  Total rejected: {len(rejected)} documents")
+    stats: Counter = Counter()
+    files: Dict[str, Dict[str, Any]] = {}
+    jobs: List[IngestJob] = []
+    file_stat: Dict[str, Tuple[int, int]] = {}
+    fingerprint = validation_fingerprint()
+    
+    for folder, validate in folders.items():
+        for p in _list_docs(folder):
+            st = os.stat(p)
+            prev = old.get(p)
+            if prev and _same_verdict(prev, validate, fingerprint) and \
+                    (prev["size"], prev["mtime"]) == (st.st_size, st.st_mtime_ns):
+                files[p] = prev
+                stats["rejected" if prev["status"] == "rejected" else "unchanged"] += 1
+                continue
+            jobs.append(IngestJob(p, validate, prev))
+            file_stat[p] = (st.st_size, st.st_mtime_ns)
+            if prev:
+                files[p] = prev  # still in the collection until the new version is committed
+    
+    # Removed files go first, so the manifest + journal always match the collection
+    removed = [p for p in old if p not in files]
+    if removed:
+        collection.delete(ids=[i for p in removed for i in old[p]["ids"]])
+        _bump_version()
+        stats["removed"] = len(removed)
+        _save_manifest(files)
     
-    return len(ids)
+    journaled: Counter = Counter()  # path -> committed chunk ids already in the journal
+    
+    def checkpoint(touched: List[IngestJob]):
+        """Per-batch commit: journal what of each touched file is in the collection now"""
+        records, stale = [], []
+        for job in touched:
+            prev_ids = job.prev["ids"] if job.prev else []
+            size, mtime = file_stat[job.path]
+            entry = {"size": size, "mtime": mtime, "validated": job.validate, "sha256": job.sha256,
+                     "rules": fingerprint if job.validate else ""}
+            if job.status == "unchanged":
+                records.append({"path": job.path, "entry": {**entry, "status": "ingested", "ids": prev_ids}})
+            elif job.status in ("ingested", "rejected"):
+                records.append({"path": job.path, "entry": {**entry, "status": job.status,
+                                                            "ids": list(job.committed)}})
+                stale.extend(set(prev_ids) - set(job.committed))
+            else:
+                records.append({"path": job.path, "validated": job.validate,
+                                "add": job.committed[journaled[job.path]:]})
+                journaled[job.path] = len(job.committed)
+        if stale:
+            collection.delete(ids=stale)
+        for r in records:
+            _apply(files, r)
+        _write_journal(records)
+        _bump_version()
+    
+    run = _pipeline(collection, annotate, on_commit=checkpoint, fingerprint=fingerprint).run(jobs)
+    
+    for job in jobs:
+        if job.status == "ingested":
+            previously_ingested = job.prev and job.prev["ids"] and \
+                not (job.prev["status"] == "partial" and job.prev["new"])
+            stats["updated" if previously_ingested else "added"] += 1
+        else:
+            stats[job.status] += 1
+    _save_manifest(files)
+    
+    return {
+        **{k: stats[k] for k in ("added", "updated", "removed", "rejected", "unchanged")},
+        "documents": sum(1 for e in files.values() if e["ids"]),
+        **run,
+        "elapsed_ms": round((perf_counter() - t0) * 1000, 1),
+    }
+
+class _RetrievalCache:
+    """LRU of query results keyed by (normalized question, k, collection version)"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            hits = self._data.get(key)
+            if hits is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hits
+
+    def put(self, key: tuple, hits: List[Dict[str, Any]]):
+        with self._lock:
+            self._data[key] = hits
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def prometheus_lines(self):
+        return [
+            "# TYPE rag_retrieval_cache_hits_total counter", f"rag_retrieval_cache_hits_total {self.hits}",
+            "# TYPE rag_retrieval_cache_misses_total counter", f"rag_retrieval_cache_misses_total {self.misses}",
+            "# TYPE rag_retrieval_cache_entries gauge", f"rag_retrieval_cache_entries {len(self._data)}",
+        ]
+
+# Repeated questions skip embedding + vector search until the collection changes (0 = off)
+RAG_RETRIEVAL_CACHE_SIZE = int(os.getenv("RAG_RETRIEVAL_CACHE_SIZE", "256"))
+_retrieval_cache: Optional[_RetrievalCache] = None
+if RAG_RETRIEVAL_CACHE_SIZE > 0:
+    _retrieval_cache = _RetrievalCache(RAG_RETRIEVAL_CACHE_SIZE)
+    metrics.register_collector(_retrieval_cache.prometheus_lines)
+
+# Identical concurrent questions share one embedding + vector search
+_query_flight = SingleFlight("retrieval")
 
 def query(question: str, k: int = 3) -> List[Dict[str, Any]]:
-    qemb = embed_texts([question])[0]
-    
+    key = (normalize_prompt(question), k, _collection_version)
+    hits = _retrieval_cache.get(key) if _retrieval_cache is not None else None
+    if hits is None:
+        hits = _query_flight.do(key, lambda: _query(question, k))
+        if _retrieval_cache is not None:
+            _retrieval_cache.put(key, hits)
+    return [{**h, "annotation": dict(h["annotation"])} for h in hits]  # callers get their own hit dicts
+
+def query_many(questions: List[str], k: int = 3) -> List[List[Dict[str, Any]]]:
+    """
+    Hits for many questions, in input order. Cached questions are answered
+    from the retrieval cache; the rest share one embedding call and one
+    vector query with all their embeddings.
+    """
+    keys = [(normalize_prompt(q), k, _collection_version) for q in questions]
+    found: Dict[tuple, List[Dict[str, Any]]] = {}
+    misses: Dict[tuple, str] = {}
+    for key, q in zip(keys, questions):
+        if key in found or key in misses:
+            continue
+        hits = _retrieval_cache.get(key) if _retrieval_cache is not None else None
+        if hits is None:
+            misses[key] = q
+        else:
+            found[key] = hits
+    if misses:
+        for key, hits in zip(misses, _query_batch(list(misses.values()), k)):
+            found[key] = hits
+            if _retrieval_cache is not None:
+                _retrieval_cache.put(key, hits)
+    return [[{**h, "annotation": dict(h["annotation"])} for h in found[key]] for key in keys]
+
+def _query(question: str, k: int) -> List[Dict[str, Any]]:
+    return _query_batch([question], k)[0]
+
+def _query_batch(questions: List[str], k: int) -> List[List[Dict[str, Any]]]:
+    qembs = embed_texts(questions)
+
     collection = get_collection()
     res: Any = collection.query(
-        query_embeddings=[qemb], 
-        n_results=k, 
+        query_embeddings=qembs,
+        n_results=k,
         include=["documents", "metadatas", "distances"]
     )
-    
-    hits: List[Dict[str, Any]] = []
-    
-    if res and res.get("ids") and len(res["ids"]) > 0:
-        for i in range(len(res["ids"][0])):
-            hits.append({
-                "id": res["ids"][0][i],
-                "text": res["documents"][0][i],
-                "source": res["metadatas"][0][i]["source_path"],
-                "distance": res["distances"][0][i],
-            })
-    
-    return hits
\ No newline at end of file
+
+    out: List[List[Dict[str, Any]]] = []
+    for j in range(len(questions)):
+        hits: List[Dict[str, Any]] = []
+        if res and res.get("ids") and len(res["ids"]) > j:
+            for i in range(len(res["ids"][j])):
+                m = res["metadatas"][j][i]
+                hits.append({
+                    "id": res["ids"][j][i],
+                    "text": res["documents"][j][i],
+                    "source": m["source_path"],
+                    "chunk": m.get("chunk_index", 0),
+                    "span": (m.get("start", 0), m.get("end", 0)),
+                    "distance": res["distances"][j][i],
+                    "annotation": {k[len(ANNOTATION_PREFIX):]: v for k, v in m.items()
+                                   if k.startswith(ANNOTATION_PREFIX)},
+                })
+        out.append(hits)
+    return out
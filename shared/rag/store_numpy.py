@@ -0,0 +1,150 @@
+"""
+In-process vector store on a memory-mapped matrix.
+
+Layout of a store directory:
+- vectors.npy  (capacity x dim) float32 or float16, L2-normalized rows,
+               opened with np.memmap so only touched pages are loaded
+- meta.sqlite  sidecar: row -> id, document, metadata (JSON)
+
+Rows 0..count-1 are live. A delete moves the last row into the freed slot,
+so the matrix stays dense and a query is one blocked matrix product over
+it plus argpartition for the top-k. Capacity doubles when the matrix is
+full. Distances are squared L2 between unit vectors (2 - 2*cosine), the
+same scale as Chroma's default space.
+
+float16 halves disk and page-cache use, but every block is converted to
+float32 before the product, which costs far more CPU than the product itself.
+"""
+import json, os, shutil, sqlite3, threading
+from typing import Any, Dict, Optional
+import numpy as np
+from shared.rag.vector_store import VectorStore
+
+BLOCK_ROWS = 65536  # rows scored per matrix product; bounds the float32 copy of float16 blocks
+
+class NumpyVectorStore(VectorStore):
+    def __init__(self, path: str, dtype: str = "float32", initial_capacity: int = 1024):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported VECTOR_STORE_DTYPE: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.ndarray] = None
+        self._open()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.npy")
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.path, "meta.sqlite"), check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS rows ("
+                             "row INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)")
+        self._count = self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        self._matrix = None
+        if os.path.exists(self._vectors_path):
+            self._matrix = np.load(self._vectors_path, mmap_mode="r+")
+            if self._matrix.dtype != self.dtype:
+                raise ValueError(f"{self._vectors_path} holds {self._matrix.dtype}, "
+                                 f"VECTOR_STORE_DTYPE is {self.dtype}")
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        if self._matrix is not None:
+            if self._matrix.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {dim} does not match the store ({self._matrix.shape[1]})")
+            if rows <= self._matrix.shape[0]:
+                return
+        capacity = self.initial_capacity if self._matrix is None else self._matrix.shape[0]
+        while capacity < rows:
+            capacity *= 2
+        tmp = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        if self._matrix is not None:
+            grown[:self._count] = self._matrix[:self._count]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp, self._vectors_path)
+        self._matrix = np.load(self._vectors_path, mmap_mode="r+")
+
+    def count(self):
+        return self._count
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs /= np.where(norms == 0, 1, norms)
+        with self._lock, self._db:
+            rows, assigned, count = [], {}, self._count
+            for i in ids:
+                if i not in assigned:
+                    found = self._db.execute("SELECT row FROM rows WHERE id = ?", (i,)).fetchone()
+                    if found is None:
+                        assigned[i] = count
+                        count += 1
+                    else:
+                        assigned[i] = found[0]
+                rows.append(assigned[i])
+            self._ensure_capacity(count, vecs.shape[1])
+            self._matrix[rows] = vecs.astype(self.dtype)  # type: ignore
+            self._count = count
+            self._db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                                 [(r, i, d, json.dumps(m)) for r, i, d, m in zip(rows, ids, documents, metadatas)])
+            self._matrix.flush()  # type: ignore
+
+    def delete(self, ids):
+        with self._lock, self._db:
+            for i in ids:
+                found = self._db.execute("SELECT row FROM rows WHERE id = ?", (i,)).fetchone()
+                if found is None:
+                    continue
+                row, last = found[0], self._count - 1
+                self._db.execute("DELETE FROM rows WHERE row = ?", (row,))
+                if row != last:
+                    self._matrix[row] = self._matrix[last]  # type: ignore
+                    self._db.execute("UPDATE rows SET row = ? WHERE row = ?", (row, last))
+                self._count -= 1
+            if self._matrix is not None:
+                self._matrix.flush()
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """(n_queries x count) cosine similarities, computed block by block"""
+        out = np.empty((queries.shape[0], self._count), dtype=np.float32)
+        for start in range(0, self._count, BLOCK_ROWS):
+            block = self._matrix[start:min(start + BLOCK_ROWS, self._count)]  # type: ignore
+            out[:, start:start + len(block)] = queries @ block.astype(np.float32, copy=False).T
+        return out
+
+    def query(self, query_embeddings, n_results, include=None):
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q /= np.where(norms == 0, 1, norms)
+        result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            k = min(n_results, self._count)
+            if k == 0:
+                for key in result:
+                    result[key] = [[] for _ in range(len(q))]
+                return result
+            scores = self._scores(q)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < self._count else \
+                np.tile(np.arange(self._count), (len(q), 1))
+            for row_scores, candidates in zip(scores, top):
+                rows = candidates[np.argsort(-row_scores[candidates], kind="stable")].tolist()
+                found = {r: (i, d, m) for r, i, d, m in self._db.execute(
+                    f"SELECT row, id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(rows))})", rows)}
+                result["ids"].append([found[r][0] for r in rows])
+                result["documents"].append([found[r][1] for r in rows])
+                result["metadatas"].append([json.loads(found[r][2]) for r in rows])
+                result["distances"].append([float(2 - 2 * row_scores[r]) for r in rows])
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._db.close()
+            self._matrix = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._open()
@@ -0,0 +1,83 @@
+"""
+Pluggable vector store for the RAG pipeline.
+
+store_chroma.py only needs a handful of collection operations, so any backend
+implementing VectorStore can sit behind it:
+- chroma: chromadb.PersistentClient (HNSW + SQLite), created on first use
+- numpy:  memory-mapped float32/float16 matrix with exact dot-product top-k
+          (shared/rag/store_numpy.py) - no server, near-zero cold start
+
+Selected with VECTOR_STORE=chroma|numpy. query() returns the Chroma result
+layout (lists of lists per query embedding) for every backend.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+class VectorStore:
+    """Interface: the collection operations the RAG store uses"""
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+               embeddings: List[List[float]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def query(self, query_embeddings: List[List[float]], n_results: int,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """{"ids", "documents", "metadatas", "distances"}: one list per query embedding, nearest first"""
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop every vector"""
+        raise NotImplementedError
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, path: str, collection: str):
+        self.path = path
+        self.collection_name = collection
+        self._client: Optional[Any] = None
+        self._collection: Optional[Any] = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            import chromadb  # only paid for when the Chroma backend is actually used
+            self._client = chromadb.PersistentClient(path=self.path)
+            self._collection = self._client.get_or_create_collection(name=self.collection_name)
+        return self._collection
+
+    def count(self):
+        return self.collection.count()
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas,
+                               embeddings=embeddings)  # type: ignore
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def query(self, query_embeddings, n_results, include=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results,  # type: ignore
+                                     include=include or ["documents", "metadatas", "distances"])
+
+    def reset(self):
+        self.collection  # make sure the client exists
+        try:
+            self._client.delete_collection(self.collection_name)  # type: ignore
+        except Exception:
+            pass
+        self._collection = self._client.get_or_create_collection(name=self.collection_name)  # type: ignore
+
+def build_vector_store(backend: str, path: str, collection: str) -> VectorStore:
+    """backend: chroma | numpy"""
+    if backend == "numpy":
+        from shared.rag.store_numpy import NumpyVectorStore
+        return NumpyVectorStore(os.path.join(path, collection),
+                                dtype=os.getenv("VECTOR_STORE_DTYPE", "float32"))
+    if backend == "chroma":
+        return ChromaVectorStore(path, collection)
+    raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")